@@ -1,4 +1,6 @@
-from pydantic import BaseModel, EmailStr
+from datetime import datetime, timezone
+
+from pydantic import BaseModel, EmailStr, NonNegativeInt, field_validator
 from pydantic_extra_types.country import CountryAlpha2
 from pydantic_extra_types.phone_numbers import PhoneNumber
 
@@ -6,6 +8,18 @@ from pydantic_extra_types.phone_numbers import PhoneNumber
 class MessageCreatePayload(BaseModel):
     body: str
     sender_id: int | None = None
+    send_at: datetime | None = None
+    # seconds, ignored when send_at is given
+    delay: NonNegativeInt | None = None
+
+    @field_validator("send_at")
+    @classmethod
+    def validate_send_at(cls, value: datetime | None) -> datetime | None:
+        # timestamps without offset are UTC
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+
+        return value
 
 
 class UserCreatePayload(BaseModel):
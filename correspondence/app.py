@@ -20,17 +20,28 @@ from taskiq import InMemoryBroker, TaskiqEvents, TaskiqMiddleware, TaskiqState
 from taskiq.abc.broker import AsyncBroker
 from taskiq.abc.result_backend import AsyncResultBackend
 from taskiq.result_backends.dummy import DummyResultBackend
-from taskiq_redis import ListQueueBroker, RedisAsyncResultBackend
+from taskiq_redis import RedisAsyncResultBackend
 
 from correspondence.api.endpoints import router as api_router
 from correspondence.builtins.extensions import CorrespondenceExtension
 from correspondence.cache import Cache, InMemoryCache, RedisCache
+from correspondence.circuitbreaker import CircuitBreaker
 from correspondence.conf import Broker as BrokerSettings
 from correspondence.conf import Cache as CacheSettings
-from correspondence.conf import Environment, Settings
+from correspondence.conf import Environment, Queue, Settings
 from correspondence.db.engine import DatabaseEngine
+from correspondence.deadletter import DeadLetterMiddleware
 from correspondence.middleware.logging import LoggingMiddleware
+from correspondence.outbox import OutboxDispatcher
 from correspondence.provider import Provider
+from correspondence.queues import (Lane, PriorityListQueueBroker,
+                                   PriorityRedisStreamBroker)
+from correspondence.ratelimit import (InMemoryRateLimiter, RateLimiter,
+                                      RedisRateLimiter, SenderRateLimiter)
+from correspondence.reassembly import ReassemblyBuffer
+from correspondence.receipts import DeliveryReceiptBuffer
+from correspondence.routing import RoutingIndex
+from correspondence.scheduler import MessageScheduler
 from correspondence.utils import import_string
 from correspondence.web.automessage import router as automessage_router
 from correspondence.web.hooks import router as hooks_router
@@ -39,11 +50,23 @@ from correspondence.web.root import router as root_router
 
 @asynccontextmanager
 async def lifespan(app: "FastAPI"):
+    await app.provider.startup()
+    await app.receipts.startup()
+    await app.routing.startup()
     if not app.broker.is_worker_process:
         await app.broker.startup()
+    # without a separate worker process the outbox is dispatched from here
+    if isinstance(app.broker, InMemoryBroker):
+        await app.outbox.startup()
+        await app.scheduler.startup()
     yield
+    await app.scheduler.shutdown()
+    await app.outbox.shutdown()
     if not app.broker.is_worker_process:
         await app.broker.shutdown()
+    await app.routing.shutdown()
+    await app.receipts.shutdown()
+    await app.provider.shutdown()
 
 
 root_dir = pathlib.Path(__file__).resolve().parent
@@ -55,6 +78,11 @@ class FastAPI(BaseFastAPI):
     db: DatabaseEngine
     settings: Settings
     provider: Provider
+    receipts: DeliveryReceiptBuffer
+    outbox: OutboxDispatcher
+    scheduler: MessageScheduler
+    reassembly: ReassemblyBuffer | None = None
+    routing: RoutingIndex
     templates = type[Jinja2Templates]
 
     @classmethod
@@ -114,12 +142,70 @@ class FastAPI(BaseFastAPI):
 
         self.templates = Jinja2Templates(env=template_env)
 
+    def setup_rate_limiter(self) -> RateLimiter:
+        rate = self.settings.SMS_PROVIDER_RATE_LIMIT
+        if not rate:
+            return RateLimiter()
+
+        options = dict(
+            rate=rate,
+            burst=self.settings.SMS_PROVIDER_RATE_LIMIT_BURST,
+            recovery=self.settings.SMS_PROVIDER_RATE_LIMIT_RECOVERY,
+        )
+
+        if isinstance(self.cache, RedisCache):
+            # shared by every process using the same provider account
+            return RedisRateLimiter(
+                self.cache.async_redis,
+                key=f"ratelimit:provider:{self.settings.SMS_PROVIDER_ACCOUNT}",
+                **options,  # type: ignore
+            )
+
+        return InMemoryRateLimiter(**options)  # type: ignore
+
+    def setup_sender_rate_limiter(self) -> SenderRateLimiter:
+        def factory(sender: str, rate: float) -> RateLimiter:
+            # no burst, carriers filter numbers sending faster than their rate
+            if isinstance(self.cache, RedisCache):
+                return RedisRateLimiter(
+                    self.cache.async_redis,
+                    key=f"ratelimit:sender:{sender}",
+                    rate=rate,
+                    burst=1,
+                )
+
+            return InMemoryRateLimiter(rate=rate, burst=1)
+
+        return SenderRateLimiter(
+            factory,
+            rate=self.settings.SMS_SENDER_RATE_LIMIT,
+            max_wait=self.settings.SMS_SENDER_MAX_WAIT,
+        )
+
     def setup_provider(self):
         klass = import_string(self.settings.SMS_PROVIDER_CLASS)
 
         self.provider = klass(
             account=self.settings.SMS_PROVIDER_ACCOUNT,
             token=self.settings.SMS_PROVIDER_TOKEN,
+            max_connections=self.settings.SMS_PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=self.settings.SMS_PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=self.settings.SMS_PROVIDER_KEEPALIVE_EXPIRY,
+            connect_timeout=self.settings.SMS_PROVIDER_CONNECT_TIMEOUT,
+            read_timeout=self.settings.SMS_PROVIDER_READ_TIMEOUT,
+            pool_timeout=self.settings.SMS_PROVIDER_POOL_TIMEOUT,
+            http2=self.settings.SMS_PROVIDER_HTTP2,
+            base_url=self.settings.SMS_PROVIDER_BASE_URL,
+            concurrency=self.settings.SMS_PROVIDER_CONCURRENCY,
+            rate_limiter=self.setup_rate_limiter(),
+            sender_rate_limiter=self.setup_sender_rate_limiter(),
+            circuit_breaker=CircuitBreaker(
+                klass.__name__,
+                failure_rate=self.settings.SMS_PROVIDER_CIRCUIT_FAILURE_RATE,
+                min_calls=self.settings.SMS_PROVIDER_CIRCUIT_MIN_CALLS,
+                reset_timeout=self.settings.SMS_PROVIDER_CIRCUIT_RESET_TIMEOUT,
+            ),
+            **self.settings.SMS_PROVIDER_OPTIONS,
         )
 
     def setup_database(self):
@@ -128,6 +214,21 @@ class FastAPI(BaseFastAPI):
         )
         engine.ping()
         self.db = engine
+        self.receipts = DeliveryReceiptBuffer(
+            engine,
+            batch_size=self.settings.DELIVERY_RECEIPT_BATCH_SIZE,
+            flush_interval=self.settings.DELIVERY_RECEIPT_FLUSH_INTERVAL,
+        )
+        self.outbox = OutboxDispatcher(
+            engine,
+            batch_size=self.settings.OUTBOX_BATCH_SIZE,
+            poll_interval=self.settings.OUTBOX_POLL_INTERVAL,
+        )
+        self.scheduler = MessageScheduler(
+            engine,
+            batch_size=self.settings.SCHEDULER_BATCH_SIZE,
+            poll_interval=self.settings.SCHEDULER_POLL_INTERVAL,
+        )
 
     def setup_cache(self):
         cache = Cache()
@@ -140,10 +241,22 @@ class FastAPI(BaseFastAPI):
             async_redis = AsyncRedis.from_url(str(self.settings.CACHE_REDIS_URL))
             sync_redis = Redis.from_url(str(self.settings.CACHE_REDIS_URL))
             cache = RedisCache(sync_redis, async_redis)
+            # fragments of inbound messages are stored as message parts in
+            # the database otherwise
+            self.reassembly = ReassemblyBuffer(
+                async_redis, ttl=self.settings.INBOUND_CONCAT_TTL
+            )
 
         cache.ping()
 
         self.cache = cache
+        self.routing = RoutingIndex(
+            self.db,
+            async_redis=cache.async_redis if isinstance(cache, RedisCache) else None,
+            ttl=self.settings.ROUTING_INDEX_TTL,
+            miss_interval=self.settings.ROUTING_INDEX_MISS_INTERVAL,
+        )
+        self.routing.track()
 
     def startup_event_generator(self) -> Callable[[TaskiqState], Awaitable[None]]:
         async def startup(state: TaskiqState) -> None:
@@ -153,6 +266,11 @@ class FastAPI(BaseFastAPI):
             state.fastapi_app = self
             self.router.routes = []
             await self.router.startup()
+            await self.provider.startup()
+            # inbound messages are routed by the worker in async mode
+            await self.routing.startup()
+            await self.outbox.startup()
+            await self.scheduler.startup()
 
         return startup
 
@@ -161,7 +279,11 @@ class FastAPI(BaseFastAPI):
             if not self.broker.is_worker_process:
                 return
 
+            await self.scheduler.shutdown()
+            await self.outbox.shutdown()
+            await self.routing.shutdown()
             await self.router.shutdown()
+            await self.provider.shutdown()
 
         return startup
 
@@ -176,12 +298,36 @@ class FastAPI(BaseFastAPI):
                 result_ex_time=600,  # 10 minutes expiration
             )
 
+        lanes = [
+            Lane(
+                Queue.interactive.value,
+                concurrency=self.settings.BROKER_INTERACTIVE_CONCURRENCY,
+            ),
+            Lane(
+                Queue.campaign.value,
+                concurrency=self.settings.BROKER_CAMPAIGN_CONCURRENCY,
+                min_share=self.settings.BROKER_CAMPAIGN_MIN_SHARE,
+            ),
+        ]
+
         self.broker = InMemoryBroker()
         if self.settings.BROKER_BACKEND == BrokerSettings.redis:
-            self.broker = ListQueueBroker(
+            self.broker = PriorityListQueueBroker(
                 url=str(self.settings.BROKER_REDIS_URL),
+                lanes=lanes,
             ).with_result_backend(result_backend)
             self.broker.add_middlewares(Middleware())
+        elif self.settings.BROKER_BACKEND == BrokerSettings.redis_streams:
+            self.broker = PriorityRedisStreamBroker(
+                url=str(self.settings.BROKER_REDIS_URL),
+                lanes=lanes,
+                reclaim_idle_timeout=self.settings.BROKER_STREAM_IDLE_TIMEOUT,
+                reclaim_interval=self.settings.BROKER_STREAM_RECLAIM_INTERVAL,
+                maxlen=self.settings.BROKER_STREAM_MAXLEN,
+            ).with_result_backend(result_backend)
+            self.broker.add_middlewares(Middleware())
+
+        self.broker.add_middlewares(DeadLetterMiddleware(self))
 
         self.broker.add_event_handler(
             TaskiqEvents.WORKER_STARTUP,
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class Batcher(Generic[K, V]):
+    """
+    Groups keys submitted concurrently into batches of at most `size` keys,
+    waiting at most `linger` seconds for a batch to fill up, and resolves
+    each submission with its entry in the mapping returned by `handler`.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[list[K]], Awaitable[dict[K, V]]],
+        size: int = 100,
+        linger: float = 0.05,
+    ):
+        self.handler = handler
+        self.size = size
+        self.linger = linger
+
+        self.pending: list[tuple[K, asyncio.Future[V | None]]] = []
+        self.timer: asyncio.TimerHandle | None = None
+        self.tasks: set[asyncio.Task] = set()
+
+    async def submit(self, key: K) -> V | None:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[V | None] = loop.create_future()
+        self.pending.append((key, future))
+
+        if len(self.pending) >= self.size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.linger, self.flush)
+
+        return await future
+
+    def flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        loop = asyncio.get_running_loop()
+
+        while self.pending:
+            batch, self.pending = self.pending[: self.size], self.pending[self.size :]
+
+            task = loop.create_task(self.process(batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def process(self, batch: list[tuple[K, asyncio.Future[V | None]]]) -> None:
+        try:
+            results = await self.handler(list(dict.fromkeys(key for key, _ in batch)))
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+
+        for key, future in batch:
+            if not future.done():
+                future.set_result(results.get(key))
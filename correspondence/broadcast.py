@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+import structlog
+
+from correspondence.db.engine import AsyncSession, DatabaseEngine
+from correspondence.models import AutoMessage, Broadcast
+from correspondence.utils import utc_now
+
+logger = structlog.get_logger("broadcast")
+
+
+async def process_batch(
+    asession: AsyncSession,
+    broadcast: Broadcast,
+    automessage: AutoMessage,
+    batch_size: int,
+) -> int:
+    """
+    Send the next batch of users and move the checkpoint, in the caller's
+    transaction so a batch is either fully recorded or replayed on resume.
+    """
+    user_ids = await broadcast.anext_user_ids(asession, batch_size)
+    if not user_ids:
+        return 0
+
+    messages = await automessage.asend_to_users(asession, user_ids)
+
+    broadcast.last_user_id = user_ids[-1]
+    broadcast.processed_count += len(user_ids)
+    broadcast.created_count += len(messages)
+    await broadcast.asave(asession, commit=False)
+
+    return len(user_ids)
+
+
+async def run_broadcast(
+    db: DatabaseEngine,
+    broadcast_id: int,
+    batch_size: int = 1000,
+    stale_after: timedelta = timedelta(minutes=10),
+) -> Broadcast | None:
+    """
+    Send the automessage of a broadcast to its users, from its checkpoint:
+    each batch commits with the checkpoint, so an interrupted broadcast is
+    resumed by running it again. A broadcast is claimed first, so it is not
+    run twice at the same time.
+    """
+    async with db.async_session_local() as asession:
+        broadcast = await Broadcast.aclaim(asession, broadcast_id, stale_after)
+        await asession.commit()
+        if broadcast is None:
+            broadcast = await Broadcast.repository(asession).aget(broadcast_id)
+            if broadcast is not None:
+                logger.info(
+                    "broadcast not claimed",
+                    broadcast_id=broadcast_id,
+                    status=broadcast.status,
+                )
+            return broadcast
+
+        automessage = await AutoMessage.repository(asession).aget(
+            broadcast.automessage_id
+        )
+        assert automessage is not None
+
+        if broadcast.total_count is None:
+            broadcast.total_count = await broadcast.acount_users(asession)
+            await broadcast.asave(asession)
+
+        try:
+            while await process_batch(asession, broadcast, automessage, batch_size):
+                await asession.commit()
+
+                logger.info(
+                    "broadcast progress",
+                    broadcast_id=broadcast.id,
+                    processed=broadcast.processed_count,
+                    created=broadcast.created_count,
+                    total=broadcast.total_count,
+                )
+        except Exception:
+            await asession.rollback()
+
+            broadcast.status = Broadcast.STATUS_FAILED
+            await broadcast.asave(asession)
+            raise
+
+        broadcast.status = Broadcast.STATUS_DONE
+        broadcast.finished_at = utc_now()
+        await broadcast.asave(asession)
+
+    return broadcast
@@ -1,10 +1,45 @@
-from sqlalchemy.orm import joinedload
+import asyncio
+from datetime import timedelta
+from typing import Any, Iterable
+
+import structlog
 from taskiq import Context, TaskiqDepends
 
+from correspondence.batcher import Batcher
+from correspondence.circuitbreaker import CircuitOpen, backoff_delay
+from correspondence.conf import Queue
+from correspondence.inbound import (InboundMessage, InboundResult,
+                                    aforget_many, areceive_many)
+from correspondence.provider import MessageResult, ProviderThrottled
+from correspondence.ratelimit import RateLimited
+
 from .main import app
 
 broker = app.broker
 
+logger = structlog.get_logger("broker")
+
+
+async def reschedule(
+    message_ids: list[int], delay: float, labels: dict[str, Any], attempt: int
+) -> None:
+    """
+    Send messages again after `delay` seconds through the outbox, on the
+    queue of `labels`: the retry is stored before the task is acked, so it
+    survives a restart of the worker.
+    """
+    from correspondence.models import OutboxMessage
+
+    async with app.db.async_session_local() as asession:
+        await OutboxMessage.aretry_many(
+            asession,
+            message_ids,
+            queue=labels.get("queue_name", Queue.interactive.value),
+            attempt=attempt,
+            delay=delay,
+        )
+        await asession.commit()
+
 
 @broker.task
 async def message(text: str) -> None:
@@ -16,21 +51,259 @@ async def error(text: str) -> None:
     raise Exception(text)
 
 
+def retry_delay(attempt: int, retry_after: float = 0) -> float:
+    return retry_after + backoff_delay(
+        attempt,
+        base=app.settings.SMS_PROVIDER_RETRY_BACKOFF_BASE,
+        cap=app.settings.SMS_PROVIDER_RETRY_BACKOFF_CAP,
+    )
+
+
+def get_claim_key(message_id: int) -> str:
+    return f"message:claim:{message_id}"
+
+
+async def claim(message_id: int) -> bool:
+    """
+    Claim a message for sending. The claim is a lease: it expires by itself
+    if the worker dies while the message is being sent.
+    """
+    return await app.cache.aadd(
+        get_claim_key(message_id),
+        "1",
+        ex=timedelta(seconds=app.settings.MESSAGE_CLAIM_TTL),
+    )
+
+
+async def release(message_ids: Iterable[int]) -> None:
+    await asyncio.gather(
+        *[app.cache.adelete(get_claim_key(message_id)) for message_id in message_ids]
+    )
+
+
+async def send_messages(message_ids: list[int]) -> dict[int, MessageResult]:
+    from correspondence.models import Message
+
+    async with app.db.async_session_local() as asession:
+        messages = await Message.aget_for_sending(asession, message_ids)
+
+        # skip messages claimed by another worker, e.g. on redelivery
+        claimed = await asyncio.gather(*[claim(message.id) for message in messages])
+        messages = [message for message, ok in zip(messages, claimed) if ok]
+        if not messages:
+            return {}
+
+        results: dict[int, MessageResult] = {}
+        try:
+            results = await Message.asend_to_provider(asession, app.provider, messages)
+            await Message.arecord_sent(asession, messages, results)
+            await asession.commit()
+        except Exception:
+            # messages accepted by the provider keep their claim until it
+            # expires: their provider ids may not be persisted, so a
+            # redelivery would send them twice
+            await release(
+                [
+                    message.id
+                    for message in messages
+                    if message.id not in results or not results[message.id].provider_ids
+                ]
+            )
+            raise
+
+    # failed messages can be retried right away, sent ones are now skipped
+    # thanks to their provider ids
+    await release(
+        [message_id for message_id, result in results.items() if not result.ok]
+    )
+
+    return results
+
+
+# message_sent tasks running concurrently in this worker are sent together
+message_batcher: Batcher[int, MessageResult] = Batcher(
+    send_messages,
+    size=app.settings.MESSAGE_SEND_BATCH_SIZE,
+    linger=app.settings.MESSAGE_SEND_BATCH_LINGER,
+)
+
+
+async def record_dead_letters(dead_letters: list[dict[str, Any]]) -> None:
+    from correspondence.models import DeadLetter
+
+    async with app.db.async_session_local() as asession:
+        await DeadLetter.arecord_many(asession, dead_letters)
+        await asession.commit()
+
+
+# not kicked anymore, the outbox relays `messages_sent`: only kept to drain the
+# tasks already queued when the outbox was deployed, its name still labels the
+# dead letters of single messages
 @broker.task
-async def message_sent(message_id: int, context: Context = TaskiqDepends()) -> None:
-    from correspondence.models import Conversation, Message
+async def message_sent(
+    message_id: int, attempt: int = 0, context: Context = TaskiqDepends()
+) -> None:
+    result = await message_batcher.submit(message_id)
+    if result is None or result.error is None:
+        return
+
+    if isinstance(result.error, RateLimited):
+        # backpressure of the sending number, not a failure of the attempt
+        await reschedule(
+            [message_id],
+            result.error.retry_after,
+            context.message.labels,
+            attempt=attempt,
+        )
+        return
+
+    if (
+        not isinstance(result.error, (CircuitOpen, ProviderThrottled))
+        or attempt + 1 >= app.settings.SMS_PROVIDER_RETRY_MAX_ATTEMPTS
+    ):
+        raise result.error
+
+    delay = retry_delay(attempt, result.error.retry_after)
+
+    logger.info(
+        "provider unavailable, message rescheduled",
+        message_id=message_id,
+        error=str(result.error),
+        attempt=attempt,
+        delay=delay,
+    )
+
+    await reschedule([message_id], delay, context.message.labels, attempt=attempt + 1)
+
+
+@broker.task
+async def messages_sent(
+    message_ids: list[int], attempt: int = 0, context: Context = TaskiqDepends()
+) -> None:
+    results = await send_messages(message_ids)
+
+    retries: list[int] = []
+    retry_after = 0.0
+    retry_error: CircuitOpen | ProviderThrottled | None = None
+    limited: list[int] = []
+    limited_retry_after = 0.0
+    failures: list[dict[str, Any]] = []
+    for message_id, result in results.items():
+        if result.error is None:
+            continue
+
+        if isinstance(result.error, RateLimited):
+            limited.append(message_id)
+            limited_retry_after = max(limited_retry_after, result.error.retry_after)
+        elif isinstance(result.error, (CircuitOpen, ProviderThrottled)):
+            # transient provider errors, retried with backoff
+            retries.append(message_id)
+            retry_after = max(retry_after, result.error.retry_after)
+            retry_error = result.error
+        else:
+            logger.error(
+                "message not sent", message_id=message_id, error=str(result.error)
+            )
+            failures.append(
+                {
+                    "task_name": message_sent.task_name,
+                    "args": [message_id],
+                    "labels": context.message.labels,
+                    "error": repr(result.error),
+                }
+            )
+
+    if failures:
+        await record_dead_letters(failures)
+
+    if limited:
+        # backpressure of the sending numbers, not a failure of the attempt
+        await reschedule(
+            limited, limited_retry_after, context.message.labels, attempt=attempt
+        )
+
+    if retry_error is None:
+        return
+
+    if attempt + 1 >= app.settings.SMS_PROVIDER_RETRY_MAX_ATTEMPTS:
+        raise retry_error
+
+    delay = retry_delay(attempt, retry_after)
+
+    logger.info(
+        "provider unavailable, messages rescheduled",
+        count=len(retries),
+        error=str(retry_error),
+        attempt=attempt,
+        delay=delay,
+    )
+
+    await reschedule(retries, delay, context.message.labels, attempt=attempt + 1)
+
+
+@broker.task
+async def automessage_contacts_sent(
+    automessage_id: int, contacts: list[dict[str, Any]]
+) -> None:
+    from correspondence.models import AutoMessage
 
     async with app.db.async_session_local() as asession:
-        message = await Message.repository(asession).aget(
-            message_id,
-            options=[
-                joinedload(Message.sender),
-                joinedload(Message.conversation).options(
-                    joinedload(Conversation.receiver),
-                    joinedload(Conversation.phone_number),
-                ),
-            ],
+        automessage = await AutoMessage.repository(asession).aget(automessage_id)
+        if automessage is None:
+            logger.warning("automessage not found", automessage_id=automessage_id)
+            return
+
+        result = await automessage.asend_many(asession, contacts)
+        await asession.commit()
+
+    if result.conflicts:
+        logger.warning(
+            "automessage contacts conflict with other users",
+            automessage_id=automessage_id,
+            phone_numbers=[contact["phone_number"] for contact in result.conflicts],
         )
 
-        if message:
-            await message.send(asession, app.provider, commit=True)
+    logger.debug(
+        "automessage contacts processed",
+        automessage_id=automessage_id,
+        count=len(contacts),
+        created=len(result.messages),
+    )
+
+
+@broker.task
+async def broadcast_sent(broadcast_id: int) -> None:
+    from correspondence.broadcast import run_broadcast
+
+    await run_broadcast(
+        app.db, broadcast_id, batch_size=app.settings.BROADCAST_BATCH_SIZE
+    )
+
+
+async def receive_messages(
+    inbounds: list[InboundMessage],
+) -> dict[InboundMessage, InboundResult]:
+    async with app.db.async_session_local() as asession:
+        results = await areceive_many(asession, app.routing, inbounds, app.reassembly)
+        try:
+            await asession.commit()
+        except Exception:
+            await aforget_many(app.reassembly, results)
+            raise
+
+    return results
+
+
+# inbound_received tasks running concurrently in this worker are written together
+inbound_batcher: Batcher[InboundMessage, InboundResult] = Batcher(
+    receive_messages,
+    size=app.settings.INBOUND_BATCH_SIZE,
+    linger=app.settings.INBOUND_BATCH_LINGER,
+)
+
+
+@broker.task
+async def inbound_received(inbound: dict[str, Any]) -> None:
+    result = await inbound_batcher.submit(InboundMessage(**inbound))
+    if result is not None and result.error is not None:
+        raise result.error
@@ -15,6 +15,18 @@ class Cache:
 
     async def aset(self, key: str, value: Any, ex: timedelta | None = None) -> None: ...
 
+    # nothing is stored, so no key is ever taken: claims and deduplication
+    # let everything through
+    def add(self, key: str, value: Any, ex: timedelta | None = None) -> bool:
+        return True
+
+    async def aadd(self, key: str, value: Any, ex: timedelta | None = None) -> bool:
+        return True
+
+    def delete(self, key: str) -> None: ...
+
+    async def adelete(self, key: str) -> None: ...
+
     def ping(self): ...
 
 
@@ -34,6 +46,22 @@ class InMemoryCache(Cache):
     async def aset(self, key: str, value: Any, ex: timedelta | None = None) -> None:
         return self.set(key, value)
 
+    def add(self, key: str, value: Any, ex: timedelta | None = None) -> bool:
+        if self.cache.has(key):
+            return False
+
+        self.cache.set(key, value, ttl=ex.total_seconds() if ex else None)
+        return True
+
+    async def aadd(self, key: str, value: Any, ex: timedelta | None = None) -> bool:
+        return self.add(key, value, ex=ex)
+
+    def delete(self, key: str) -> None:
+        self.cache.delete(key)
+
+    async def adelete(self, key: str) -> None:
+        return self.delete(key)
+
 
 class RedisCache(Cache):
     def __init__(self, sync_redis: Redis, async_redis: AsyncRedis):
@@ -60,3 +88,15 @@ class RedisCache(Cache):
 
     async def aset(self, key: str, value: Any, ex: timedelta | None = None) -> None:
         await self.async_redis.set(key, px=ex, value=value)
+
+    def add(self, key: str, value: Any, ex: timedelta | None = None) -> bool:
+        return bool(self.sync_redis.set(key, px=ex, value=value, nx=True))
+
+    async def aadd(self, key: str, value: Any, ex: timedelta | None = None) -> bool:
+        return bool(await self.async_redis.set(key, px=ex, value=value, nx=True))
+
+    def delete(self, key: str) -> None:
+        self.sync_redis.delete(key)
+
+    async def adelete(self, key: str) -> None:
+        await self.async_redis.delete(key)
@@ -0,0 +1,105 @@
+import random
+import time
+from collections import deque
+from enum import Enum
+
+
+class CircuitState(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"circuit {name} is open, retry in {retry_after:.1f}s")
+
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens when the failure rate over the last `window` calls reaches
+    `failure_rate` (after at least `min_calls` calls). Once `reset_timeout`
+    has elapsed a single probe call is let through (half-open): its success
+    closes the circuit, its failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate: float = 0.5,
+        min_calls: int = 20,
+        window: int = 100,
+        reset_timeout: float = 30.0,
+    ):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+
+        self.state = CircuitState.closed
+        self.results: deque[bool] = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probing = False
+        self.probe_started_at = 0.0
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before_call(self) -> None:
+        if self.state == CircuitState.closed:
+            return
+
+        if self.state == CircuitState.open:
+            if self.retry_after > 0:
+                raise CircuitOpen(self.name, self.retry_after)
+
+            self.state = CircuitState.half_open
+
+        # a probe which never reported back (e.g. cancelled) is given up
+        # after reset_timeout so the circuit cannot stay stuck half-open
+        now = time.monotonic()
+        if self.probing and now - self.probe_started_at < self.reset_timeout:
+            raise CircuitOpen(self.name, self.reset_timeout)
+
+        self.probing = True
+        self.probe_started_at = now
+
+    def record_success(self) -> None:
+        if self.state == CircuitState.half_open:
+            self.close()
+            return
+
+        self.results.append(True)
+
+    def record_failure(self) -> None:
+        if self.state == CircuitState.half_open:
+            self.open()
+            return
+
+        self.results.append(False)
+
+        if len(self.results) < self.min_calls:
+            return
+
+        failures = self.results.count(False)
+        if failures / len(self.results) >= self.failure_rate:
+            self.open()
+
+    def open(self) -> None:
+        self.state = CircuitState.open
+        self.opened_at = time.monotonic()
+        self.probing = False
+
+    def close(self) -> None:
+        self.state = CircuitState.closed
+        self.results.clear()
+        self.probing = False
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 300.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2**attempt))
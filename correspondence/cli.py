@@ -1,13 +1,42 @@
+import asyncio
 import os
 import sys
+from datetime import datetime, timedelta
+from typing import Annotated, Optional
 
 import typer
 
 from correspondence import models
+from correspondence.conf import Queue
+from correspondence.deadletter import replay_all
 from correspondence.main import app
+from correspondence.queues import PriorityRedisStreamBroker
+from correspondence.utils import utc_now
 
 cli = typer.Typer()
 
+deadletter = typer.Typer(help="Inspect and replay failed tasks.")
+cli.add_typer(deadletter, name="deadletter")
+
+broadcast = typer.Typer(help="Send automessages to segments of users.")
+cli.add_typer(broadcast, name="broadcast")
+
+TaskOption = Annotated[
+    Optional[str],
+    typer.Option(help="Task name, e.g. correspondence.broker:message_sent"),
+]
+ErrorOption = Annotated[Optional[str], typer.Option(help="Part of the error message")]
+SinceOption = Annotated[
+    Optional[int], typer.Option(help="Only tasks failed in the last minutes")
+]
+
+
+def get_since(since: int | None) -> datetime | None:
+    if since is None:
+        return None
+
+    return utc_now() - timedelta(minutes=since)
+
 
 @cli.command()
 def root():
@@ -38,5 +67,186 @@ def shell():
     IPython.embed(banner1=banner, user_ns=ctx)
 
 
+@cli.command()
+def queues():
+    if not isinstance(app.broker, PriorityRedisStreamBroker):
+        typer.echo("queue stats require BROKER_BACKEND=redis_streams", err=True)
+        raise typer.Exit(1)
+
+    stats = asyncio.run(app.broker.stats())
+    for queue_name, values in stats.items():
+        typer.echo(
+            f"{queue_name}\tlength={values['length']}\tpending={values['pending']}"
+            f"\tlag={values['lag']}\tconsumers={values['consumers']}"
+        )
+
+
+@deadletter.command("list")
+def deadletter_list(
+    task: TaskOption = None,
+    error: ErrorOption = None,
+    since: SinceOption = None,
+    replayed: Annotated[bool, typer.Option(help="Include replayed tasks")] = False,
+    limit: int = 50,
+):
+    async def run():
+        query = (
+            models.DeadLetter.filter(
+                task_name=task, error=error, since=get_since(since), replayed=replayed
+            )
+            .order_by(models.DeadLetter.updated_at.desc())
+            .limit(limit)
+        )
+
+        async with app.db.async_session_local() as asession:
+            dead_letters = await models.DeadLetter.repository(asession).aget_all(query)
+
+        for dead_letter in dead_letters:
+            typer.echo(
+                f"{dead_letter.id}\t{dead_letter.updated_at.isoformat()}\t"
+                f"{dead_letter.task_name}\t{dead_letter.args}\t"
+                f"attempts={dead_letter.attempts}\t{dead_letter.error}"
+            )
+
+    asyncio.run(run())
+
+
+@deadletter.command("replay")
+def deadletter_replay(
+    task: TaskOption = None,
+    error: ErrorOption = None,
+    since: SinceOption = None,
+    batch_size: int = 500,
+    rate: Annotated[float, typer.Option(help="Tasks per second, 0 to disable")] = 0,
+):
+    async def run():
+        await app.broker.startup()
+        try:
+            async with app.db.async_session_local() as asession:
+                count = await replay_all(
+                    asession,
+                    app.broker,
+                    task_name=task,
+                    error=error,
+                    since=get_since(since),
+                    batch_size=batch_size,
+                    rate=rate,
+                )
+        finally:
+            await app.broker.shutdown()
+
+        typer.echo(f"{count} tasks replayed")
+
+    asyncio.run(run())
+
+
+def echo_broadcast(instance: models.Broadcast) -> None:
+    typer.echo(
+        f"broadcast {instance.id}: {instance.status}, "
+        f"{instance.processed_count}/{instance.total_count or '?'} users processed, "
+        f"{instance.created_count} messages created"
+    )
+
+
+@broadcast.command("create")
+def broadcast_create(
+    automessage_id: int,
+    organization: Annotated[str, typer.Option(help="Organization slug")],
+    staff: Annotated[Optional[bool], typer.Option("--staff/--no-staff")] = None,
+    manager_id: Optional[int] = None,
+    country: Optional[str] = None,
+    q: Annotated[Optional[str], typer.Option(help="Full-text search")] = None,
+    run: Annotated[bool, typer.Option(help="Run here instead of a worker")] = False,
+):
+    from correspondence.broadcast import run_broadcast
+    from correspondence.broker import broadcast_sent
+
+    filters = {
+        "is_staff": staff,
+        "manager_id": manager_id,
+        "country": country,
+        "q": q,
+    }
+
+    async def create() -> models.Broadcast:
+        async with app.db.async_session_local() as asession:
+            org = await models.Organization.repository(asession).aget_by(
+                filter_by={"slug": organization}
+            )
+            if org is None:
+                typer.echo(f"unknown organization: {organization}", err=True)
+                raise typer.Exit(1)
+
+            automessage = await models.AutoMessage.repository(asession).aget(
+                automessage_id
+            )
+            if automessage is None or automessage.organization_id != org.id:
+                typer.echo(
+                    f"unknown automessage {automessage_id} in {organization}",
+                    err=True,
+                )
+                raise typer.Exit(1)
+
+            instance = await models.Broadcast.repository(asession).acreate(
+                automessage_id=automessage_id,
+                organization_id=org.id,
+                filters={k: v for k, v in filters.items() if v is not None},
+            )
+            instance.total_count = await instance.acount_users(asession)
+            await instance.asave(asession)
+
+        if run:
+            return (
+                await run_broadcast(
+                    app.db, instance.id, batch_size=app.settings.BROADCAST_BATCH_SIZE
+                )
+                or instance
+            )
+
+        await app.broker.startup()
+        try:
+            await (
+                broadcast_sent.kicker()
+                .with_labels(queue_name=Queue.campaign.value)
+                .kiq(instance.id)
+            )
+        finally:
+            await app.broker.shutdown()
+
+        return instance
+
+    echo_broadcast(asyncio.run(create()))
+
+
+@broadcast.command("resume")
+def broadcast_resume(broadcast_id: int):
+    from correspondence.broadcast import run_broadcast
+
+    instance = asyncio.run(
+        run_broadcast(
+            app.db, broadcast_id, batch_size=app.settings.BROADCAST_BATCH_SIZE
+        )
+    )
+    if instance is None:
+        typer.echo(f"unknown broadcast: {broadcast_id}", err=True)
+        raise typer.Exit(1)
+
+    echo_broadcast(instance)
+
+
+@broadcast.command("status")
+def broadcast_status(broadcast_id: int):
+    async def get() -> models.Broadcast | None:
+        async with app.db.async_session_local() as asession:
+            return await models.Broadcast.repository(asession).aget(broadcast_id)
+
+    instance = asyncio.run(get())
+    if instance is None:
+        typer.echo(f"unknown broadcast: {broadcast_id}", err=True)
+        raise typer.Exit(1)
+
+    echo_broadcast(instance)
+
+
 if __name__ == "__main__":
     cli()
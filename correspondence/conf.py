@@ -1,8 +1,9 @@
+import importlib.util
 import os
 from enum import Enum
-from typing import Optional
+from typing import Any, Optional
 
-from pydantic import PostgresDsn, RedisDsn
+from pydantic import PostgresDsn, RedisDsn, field_validator
 from pydantic_settings import BaseSettings
 
 
@@ -16,6 +17,12 @@ class Environment(str, Enum):
 class Broker(str, Enum):
     inmemory = "inmemory"
     redis = "redis"
+    redis_streams = "redis_streams"
+
+
+class Queue(str, Enum):
+    interactive = "correspondence:interactive"
+    campaign = "correspondence:campaign"
 
 
 class Cache(str, Enum):
@@ -26,6 +33,23 @@ class Cache(str, Enum):
 class Settings(BaseSettings):
     SENTRY_DSN: str | None = None
     DEFAULT_COUNTRY: str = "FR"
+    PHONE_NUMBER_CACHE_SIZE: int = 100_000
+    AUTOMESSAGE_BULK_BATCH_SIZE: int = 1000
+    # answer automessage webhooks with 202 and create messages in the worker
+    AUTOMESSAGE_ASYNC: bool = False
+    AUTOMESSAGE_DEDUPE_TTL: int = 60  # seconds, 0 to disable
+    # seconds known automessages are cached by asynchronous webhooks
+    AUTOMESSAGE_EXISTS_TTL: int = 300
+    BROADCAST_BATCH_SIZE: int = 1000
+    # seconds before reloading numbers changed outside of this application
+    ROUTING_INDEX_TTL: float = 300.0
+    # seconds between reloads on unknown numbers
+    ROUTING_INDEX_MISS_INTERVAL: float = 5.0
+    # answer inbound webhooks right away and write messages in the worker
+    INBOUND_ASYNC: bool = False
+    INBOUND_BATCH_SIZE: int = 100
+    INBOUND_BATCH_LINGER: float = 0.05
+    INBOUND_CONCAT_TTL: int = 60 * 60 * 24  # seconds to wait for every fragment
     SESSION_COOKIE_NAME: str = "correspondence_session"
     SESSION_COOKIE_AGE: int = 60 * 60 * 24 * 31  # 31 days
     ENV: Environment = Environment.development
@@ -37,6 +61,12 @@ class Settings(BaseSettings):
     BROKER_REDIS_URL: Optional[RedisDsn] = None
     BROKER_RESULT_BACKEND: str = Broker.inmemory
     BROKER_RESULT_REDIS_URL: Optional[RedisDsn] = None
+    BROKER_INTERACTIVE_CONCURRENCY: int = 50
+    BROKER_CAMPAIGN_CONCURRENCY: int = 50
+    BROKER_CAMPAIGN_MIN_SHARE: float = 0.2
+    BROKER_STREAM_IDLE_TIMEOUT: float = 600.0
+    BROKER_STREAM_RECLAIM_INTERVAL: float = 30.0
+    BROKER_STREAM_MAXLEN: Optional[int] = None
     DEBUG: bool = False
     SECRET: str = "super secret jwt secret"
     LOG_LEVEL: str = "INFO"
@@ -44,6 +74,49 @@ class Settings(BaseSettings):
     SMS_PROVIDER_CLASS: str = "correspondence.provider.NoopProvider"
     SMS_PROVIDER_ACCOUNT: str = ""
     SMS_PROVIDER_TOKEN: str = ""
+    SMS_PROVIDER_BASE_URL: str | None = None
+    SMS_PROVIDER_OPTIONS: dict[str, Any] = {}
+    SMS_PROVIDER_MAX_CONNECTIONS: int = 100
+    SMS_PROVIDER_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    SMS_PROVIDER_KEEPALIVE_EXPIRY: float = 30.0
+    SMS_PROVIDER_CONNECT_TIMEOUT: float = 5.0
+    SMS_PROVIDER_READ_TIMEOUT: float = 10.0
+    SMS_PROVIDER_POOL_TIMEOUT: float = 5.0
+    SMS_PROVIDER_HTTP2: bool = False
+    SMS_PROVIDER_CONCURRENCY: int = 10
+    SMS_PROVIDER_RATE_LIMIT: float = 0  # messages per second, 0 to disable
+    SMS_PROVIDER_RATE_LIMIT_BURST: float | None = None
+    SMS_PROVIDER_RATE_LIMIT_RECOVERY: float = 0.5
+    SMS_SENDER_RATE_LIMIT: float = 0  # per sending number, 0 to disable
+    # longest wait for a sending number slot, messages further away are
+    # retried later: keep it well under MESSAGE_CLAIM_TTL
+    SMS_SENDER_MAX_WAIT: float = 60.0
+    SMS_PROVIDER_CIRCUIT_FAILURE_RATE: float = 0.5
+    SMS_PROVIDER_CIRCUIT_MIN_CALLS: int = 20
+    SMS_PROVIDER_CIRCUIT_RESET_TIMEOUT: float = 30.0
+    SMS_PROVIDER_RETRY_MAX_ATTEMPTS: int = 10
+    SMS_PROVIDER_RETRY_BACKOFF_BASE: float = 1.0
+    SMS_PROVIDER_RETRY_BACKOFF_CAP: float = 300.0
+    MESSAGE_SEND_BATCH_SIZE: int = 100
+    MESSAGE_SEND_BATCH_LINGER: float = 0.05
+    MESSAGE_CLAIM_TTL: int = 300  # seconds
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_POLL_INTERVAL: float = 0.5
+    SCHEDULER_BATCH_SIZE: int = 500
+    SCHEDULER_POLL_INTERVAL: float = 1.0
+    DELIVERY_RECEIPT_BATCH_SIZE: int = 500
+    DELIVERY_RECEIPT_FLUSH_INTERVAL: float = 1.0
+
+    @field_validator("SMS_PROVIDER_HTTP2")
+    @classmethod
+    def check_http2(cls, value: bool) -> bool:
+        # fail at startup, httpx would only raise when creating the client
+        if value and importlib.util.find_spec("h2") is None:
+            raise ValueError(
+                "SMS_PROVIDER_HTTP2 requires the h2 package, install httpx[http2]"
+            )
+
+        return value
 
 
 env = Environment(os.getenv("CORRESPONDENCE_API_ENV", Environment.development))
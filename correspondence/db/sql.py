@@ -1,6 +1,6 @@
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.sql import (Delete, Select, Update, delete, exists, func,
-                            select, text, update)
+                            literal, select, text, update)
 
 Insert = postgresql.Insert
 insert = postgresql.insert
@@ -17,4 +17,5 @@ __all__ = [
     "func",
     "text",
     "exists",
+    "literal",
 ]
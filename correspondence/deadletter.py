@@ -0,0 +1,157 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
+
+import structlog
+from taskiq import AsyncBroker, TaskiqMessage, TaskiqMiddleware, TaskiqResult
+
+from correspondence.db.engine import AsyncSession
+from correspondence.utils import utc_now
+
+if TYPE_CHECKING:
+    from correspondence.app import FastAPI
+    from correspondence.models import DeadLetter
+
+logger = structlog.get_logger("deadletter")
+
+
+class DeadLetterMiddleware(TaskiqMiddleware):
+    """
+    Records tasks which raised in the dead letter table so they can be
+    replayed later with `correspondence deadletter replay`.
+    """
+
+    def __init__(self, app: "FastAPI"):
+        super().__init__()
+
+        self.app = app
+
+    async def on_error(
+        self,
+        message: TaskiqMessage,
+        result: TaskiqResult[Any],
+        exception: BaseException,
+    ) -> None:
+        from correspondence.models import DeadLetter
+
+        try:
+            async with self.app.db.async_session_local() as asession:
+                await DeadLetter.arecord_many(
+                    asession,
+                    [
+                        {
+                            "task_name": message.task_name,
+                            "args": message.args,
+                            "kwargs": message.kwargs,
+                            "labels": message.labels,
+                            "error": repr(exception),
+                        }
+                    ],
+                )
+                await asession.commit()
+        except Exception:
+            logger.exception(
+                "unable to record dead letter",
+                task_name=message.task_name,
+                task_id=message.task_id,
+            )
+
+
+async def replay(
+    asession: AsyncSession,
+    broker: AsyncBroker,
+    dead_letters: list["DeadLetter"],
+) -> int:
+    """
+    Kick the tasks of `dead_letters` again and mark them as replayed.
+    Single message sends are grouped by queue into `messages_sent` tasks.
+    """
+    from correspondence.broker import message_sent, messages_sent
+    from correspondence.models import DeadLetter
+
+    queues: dict[str, list[int]] = defaultdict(list)
+    replayed: list[int] = []
+    for dead_letter in dead_letters:
+        # the retry count starts over, the dead letter keeps the attempts
+        kwargs = dict(dead_letter.kwargs)
+        if "attempt" in kwargs:
+            kwargs["attempt"] = 0
+
+        queue_name = dead_letter.labels.get("queue_name")
+
+        if dead_letter.task_name == message_sent.task_name and queue_name:
+            queues[queue_name].extend(dead_letter.args)
+        elif dead_letter.task_name == messages_sent.task_name and queue_name:
+            queues[queue_name].extend(dead_letter.args[0])
+        else:
+            task = broker.find_task(dead_letter.task_name)
+            if task is None:
+                logger.warning("unknown task", task_name=dead_letter.task_name)
+                continue
+
+            await (
+                task.kicker()
+                .with_labels(**dead_letter.labels)
+                .kiq(*dead_letter.args, **kwargs)
+            )
+
+        replayed.append(dead_letter.id)
+
+    for queue_name, message_ids in queues.items():
+        await (
+            messages_sent.kicker()
+            .with_labels(queue_name=queue_name)
+            .kiq(list(dict.fromkeys(message_ids)))
+        )
+
+    if replayed:
+        await DeadLetter.repository(asession).abulk_update(
+            clauses=[DeadLetter.id.in_(replayed)], replayed_at=utc_now()
+        )
+
+    return len(replayed)
+
+
+async def replay_all(
+    asession: AsyncSession,
+    broker: AsyncBroker,
+    task_name: str | None = None,
+    error: str | None = None,
+    since: datetime | None = None,
+    batch_size: int = 500,
+    rate: float = 0,
+) -> int:
+    """
+    Replay matching dead letters in batches of `batch_size`, committing
+    after each batch, at most `rate` dead letters per second when set.
+    """
+    from correspondence.models import DeadLetter
+
+    count = 0
+    last_id = 0
+    loop = asyncio.get_running_loop()
+    while True:
+        started_at = loop.time()
+
+        # keyset pagination, replayed rows are left out of the next batches
+        query = (
+            DeadLetter.filter(task_name=task_name, error=error, since=since)
+            .where(DeadLetter.id > last_id)
+            .order_by(DeadLetter.id)
+            .limit(batch_size)
+        )
+        dead_letters = list(await DeadLetter.repository(asession).aget_all(query))
+        if not dead_letters:
+            return count
+
+        count += await replay(asession, broker, dead_letters)
+        await asession.commit()
+
+        last_id = dead_letters[-1].id
+
+        logger.info("dead letters replayed", count=count)
+
+        if rate:
+            elapsed = loop.time() - started_at
+            await asyncio.sleep(max(0.0, len(dead_letters) / rate - elapsed))
@@ -0,0 +1,76 @@
+import dataclasses
+import math
+from enum import Enum
+
+# https://en.wikipedia.org/wiki/GSM_03.38
+GSM7_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+
+# extension table characters, sent as an escape + character (2 septets)
+GSM7_EXTENDED = frozenset("\f^{}\\[~]|€")
+
+GSM7_SINGLE_LENGTH = 160
+GSM7_PART_LENGTH = 153
+UCS2_SINGLE_LENGTH = 70
+UCS2_PART_LENGTH = 67
+
+
+class Encoding(str, Enum):
+    gsm7 = "gsm7"
+    ucs2 = "ucs2"
+
+
+@dataclasses.dataclass
+class BodyInfo:
+    encoding: Encoding
+    length: int
+    segments: int
+
+
+def is_gsm7(text: str) -> bool:
+    return all(char in GSM7_BASIC or char in GSM7_EXTENDED for char in text)
+
+
+def gsm7_septets(char: str) -> int:
+    return 2 if char in GSM7_EXTENDED else 1
+
+
+def count_gsm7_segments(text: str) -> tuple[int, int]:
+    length = sum(gsm7_septets(char) for char in text)
+    if length <= GSM7_SINGLE_LENGTH:
+        return length, 1
+
+    # an escaped character cannot be split across two parts
+    segments, current = 1, 0
+    for char in text:
+        septets = gsm7_septets(char)
+        if current + septets > GSM7_PART_LENGTH:
+            segments += 1
+            current = 0
+        current += septets
+
+    return length, segments
+
+
+def count_ucs2_segments(text: str) -> tuple[int, int]:
+    # characters outside the BMP take two UTF-16 code units
+    length = len(text.encode("utf-16-le")) // 2
+    if length <= UCS2_SINGLE_LENGTH:
+        return length, 1
+
+    return length, math.ceil(length / UCS2_PART_LENGTH)
+
+
+def analyse(text: str) -> BodyInfo:
+    if is_gsm7(text):
+        length, segments = count_gsm7_segments(text)
+        return BodyInfo(encoding=Encoding.gsm7, length=length, segments=segments)
+
+    length, segments = count_ucs2_segments(text)
+    return BodyInfo(encoding=Encoding.ucs2, length=length, segments=segments)
+
+
+def count_segments(text: str) -> int:
+    return analyse(text).segments
@@ -0,0 +1,221 @@
+import dataclasses
+from typing import TYPE_CHECKING, Any
+
+import structlog
+from sqlalchemy.sql import ColumnElement
+
+from correspondence.db.engine import AsyncSession
+from correspondence.reassembly import MessageFragment, ReassemblyBuffer
+from correspondence.routing import RoutingIndex
+
+if TYPE_CHECKING:
+    from correspondence.models import Message, User
+
+logger = structlog.get_logger("inbound")
+
+
+@dataclasses.dataclass(frozen=True)
+class InboundMessage:
+    """
+    A message received from a provider, or a fragment of a concatenated one,
+    with phone numbers in E.164.
+    """
+
+    sender: str
+    receiver: str
+    provider_id: str
+    text: str
+    concat_ref: str | None = None
+    concat_part: int | None = None
+    concat_total: int | None = None
+
+    @property
+    def is_fragment(self) -> bool:
+        return self.concat_ref is not None
+
+    def to_dict(self) -> dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+@dataclasses.dataclass
+class InboundResult:
+    organization_id: int | None = None
+    message_id: int | None = None
+    error: BaseException | None = None
+
+
+async def aforget(
+    reassembly: ReassemblyBuffer | None, organization_id: int, inbound: InboundMessage
+) -> None:
+    """
+    Forget a fragment whose message could not be written, so its retry
+    completes the message again.
+    """
+    if reassembly is None or not inbound.is_fragment:
+        return
+
+    assert inbound.concat_ref is not None and inbound.concat_part is not None
+
+    await reassembly.remove(organization_id, inbound.concat_ref, inbound.concat_part)
+
+
+async def aforget_many(
+    reassembly: ReassemblyBuffer | None,
+    results: dict[InboundMessage, InboundResult],
+) -> None:
+    """
+    Forget the fragments which completed messages of a batch which could not
+    be committed.
+    """
+    for inbound, result in results.items():
+        if result.organization_id is not None and result.message_id is not None:
+            await aforget(reassembly, result.organization_id, inbound)
+
+
+async def areceive(
+    asession: AsyncSession,
+    user: "User",
+    organization_id: int,
+    inbound: InboundMessage,
+    reassembly: ReassemblyBuffer | None = None,
+) -> "Message | None":
+    """
+    Write an inbound message of `user`, returns it, or `None` for a fragment
+    until every fragment of its message has been received.
+    """
+    from correspondence.models import MessagePart
+
+    if not inbound.is_fragment:
+        return await user.create_message(
+            asession,
+            inbound.text,
+            send=False,
+            extra_data={"provider_ids": [inbound.provider_id]},
+        )
+
+    assert inbound.concat_part is not None and inbound.concat_ref is not None
+
+    if reassembly is not None:
+        fragments = await reassembly.add(
+            organization_id,
+            inbound.concat_ref,
+            inbound.concat_total or 0,
+            MessageFragment(
+                part=inbound.concat_part,
+                body=inbound.text,
+                provider_id=inbound.provider_id,
+            ),
+        )
+        if fragments is None:
+            return None
+
+        try:
+            return await user.create_message(
+                asession,
+                "".join([fragment.body for fragment in fragments]),
+                send=False,
+                extra_data={
+                    "provider_ids": [fragment.provider_id for fragment in fragments]
+                },
+            )
+        except Exception:
+            await aforget(reassembly, organization_id, inbound)
+            raise
+
+    repo = MessagePart.repository(asession)
+    await repo.aget_or_create(
+        part_id=inbound.concat_part,
+        part_ref=inbound.concat_ref,
+        organization_id=organization_id,
+        defaults={
+            "body": inbound.text,
+            "sender_id": user.id,
+            "provider_id": inbound.provider_id,
+        },
+    )
+    # not committed when received in a batch
+    await asession.flush()
+
+    clauses: list[ColumnElement[bool]] = [
+        MessagePart.organization_id == organization_id,
+        MessagePart.part_ref == inbound.concat_ref,
+        MessagePart.message_id.is_(None),
+    ]
+    parts = await repo.aall(clauses=clauses)
+    if len(parts) != inbound.concat_total:
+        return None
+
+    parts = sorted(parts, key=lambda part: part.part_id)
+
+    async with asession.begin_nested():
+        message = await user.create_message(
+            asession,
+            "".join([part.body for part in parts]),
+            send=False,
+            extra_data={"provider_ids": [part.provider_id for part in parts]},
+        )
+
+        await asession.flush()
+        await repo.abulk_update(clauses=clauses, message_id=message.id)
+
+    return message
+
+
+async def areceive_many(
+    asession: AsyncSession,
+    routing: RoutingIndex,
+    inbounds: list[InboundMessage],
+    reassembly: ReassemblyBuffer | None = None,
+) -> dict[InboundMessage, InboundResult]:
+    """
+    Write a batch of inbound messages in the caller's transaction: receivers
+    are routed in memory and senders looked up with a single query. Each
+    message has its own savepoint so a failure only loses this message.
+    """
+    from correspondence.models import User
+
+    organization_ids = {
+        inbound: await routing.get(asession, inbound.receiver) for inbound in inbounds
+    }
+    users = await User.get_many_from_phone_numbers(
+        asession,
+        [
+            (organization_id, inbound.sender)
+            for inbound, organization_id in organization_ids.items()
+            if organization_id is not None
+        ],
+    )
+
+    results: dict[InboundMessage, InboundResult] = {}
+    for inbound, organization_id in organization_ids.items():
+        user = (
+            users.get((organization_id, inbound.sender))
+            if organization_id is not None
+            else None
+        )
+        if organization_id is None or user is None:
+            # unknown numbers are answered with a 404 inline, nothing to retry
+            logger.warning(
+                "inbound message dropped",
+                sender=inbound.sender,
+                receiver=inbound.receiver,
+                provider_id=inbound.provider_id,
+            )
+            results[inbound] = InboundResult()
+            continue
+
+        try:
+            async with asession.begin_nested():
+                message = await areceive(
+                    asession, user, organization_id, inbound, reassembly
+                )
+        except Exception as exc:
+            results[inbound] = InboundResult(organization_id=organization_id, error=exc)
+            continue
+
+        results[inbound] = InboundResult(
+            organization_id=organization_id,
+            message_id=message.id if message is not None else None,
+        )
+
+    return results
@@ -0,0 +1,57 @@
+"""broadcast
+
+Revision ID: 2b7c9e1f6a08
+Revises: 6f2a8d0b3e74
+Create Date: 2026-10-18 22:14:48.127593
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "2b7c9e1f6a08"
+down_revision = "6f2a8d0b3e74"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "correspondence_broadcast",
+        sa.Column("automessage_id", sa.Integer(), nullable=False),
+        sa.Column("organization_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "filters",
+            postgresql.JSONB(astext_type=sa.Text()),
+            server_default="{}",
+            nullable=False,
+        ),
+        sa.Column(
+            "status", sa.String(length=50), server_default="pending", nullable=False
+        ),
+        sa.Column("last_user_id", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("total_count", sa.Integer(), nullable=True),
+        sa.Column("processed_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("created_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("finished_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("id", sa.INTEGER(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["automessage_id"],
+            ["correspondence_automessage.id"],
+            name=op.f("correspondence_broadcast_automessage_id_fkey"),
+        ),
+        sa.ForeignKeyConstraint(
+            ["organization_id"],
+            ["correspondence_organization.id"],
+            name=op.f("correspondence_broadcast_organization_id_fkey"),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("correspondence_broadcast_pkey")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("correspondence_broadcast")
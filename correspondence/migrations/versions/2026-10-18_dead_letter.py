@@ -0,0 +1,66 @@
+"""dead letter
+
+Revision ID: 9c1e7f4a5d26
+Revises: 3d8f6a2c4b19
+Create Date: 2026-10-18 19:21:07.583920
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "9c1e7f4a5d26"
+down_revision = "3d8f6a2c4b19"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "correspondence_dead_letter",
+        # sha256 digest of the task name and args, see DeadLetter.get_key
+        sa.Column("key", sa.Text(), nullable=False),
+        sa.Column("task_name", sa.String(length=255), nullable=False),
+        sa.Column(
+            "args",
+            postgresql.JSONB(astext_type=sa.Text()),
+            server_default="[]",
+            nullable=False,
+        ),
+        sa.Column(
+            "kwargs",
+            postgresql.JSONB(astext_type=sa.Text()),
+            server_default="{}",
+            nullable=False,
+        ),
+        sa.Column(
+            "labels",
+            postgresql.JSONB(astext_type=sa.Text()),
+            server_default="{}",
+            nullable=False,
+        ),
+        sa.Column("error", sa.Text(), nullable=False),
+        sa.Column("attempts", sa.Integer(), server_default="1", nullable=False),
+        sa.Column("replayed_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("id", sa.INTEGER(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id", name=op.f("correspondence_dead_letter_pkey")),
+        sa.UniqueConstraint("key", name=op.f("correspondence_dead_letter_key_key")),
+    )
+    op.create_index(
+        op.f("ix_correspondence_dead_letter_task_name"),
+        "correspondence_dead_letter",
+        ["task_name"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        op.f("ix_correspondence_dead_letter_task_name"),
+        table_name="correspondence_dead_letter",
+    )
+    op.drop_table("correspondence_dead_letter")
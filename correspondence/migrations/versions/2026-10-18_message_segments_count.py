@@ -0,0 +1,27 @@
+"""message segments count
+
+Revision ID: 5c2b7e0d91a4
+Revises: 1fea454012c8
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "5c2b7e0d91a4"
+down_revision = "1fea454012c8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "correspondence_message",
+        sa.Column("segments_count", sa.Integer(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("correspondence_message", "segments_count")
@@ -0,0 +1,49 @@
+"""message send at
+
+Revision ID: 3d8f6a2c4b19
+Revises: 7b3a5e91c0d2
+Create Date: 2026-10-18 18:02:55.417306
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "3d8f6a2c4b19"
+down_revision = "7b3a5e91c0d2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "correspondence_message",
+        sa.Column("status", sa.String(length=50), nullable=True),
+    )
+    op.add_column(
+        "correspondence_message",
+        sa.Column("send_at", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.create_index(
+        "correspondence_message_send_at_idx",
+        "correspondence_message",
+        ["send_at"],
+        unique=False,
+        postgresql_where=sa.text("status = 'scheduled'"),
+    )
+    op.add_column(
+        "correspondence_automessage",
+        sa.Column("delay", sa.Integer(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("correspondence_automessage", "delay")
+    op.drop_index(
+        "correspondence_message_send_at_idx",
+        table_name="correspondence_message",
+        postgresql_where=sa.text("status = 'scheduled'"),
+    )
+    op.drop_column("correspondence_message", "send_at")
+    op.drop_column("correspondence_message", "status")
@@ -0,0 +1,62 @@
+"""message status
+
+Revision ID: a81f3c6d2e57
+Revises: 5c2b7e0d91a4
+Create Date: 2026-10-18 11:03:27.918342
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy import func
+
+# revision identifiers, used by Alembic.
+revision = "a81f3c6d2e57"
+down_revision = "5c2b7e0d91a4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "correspondence_message_status",
+        sa.Column("provider_id", sa.String(length=100), nullable=False),
+        sa.Column("status", sa.String(length=50), nullable=False),
+        sa.Column("error_code", sa.String(length=50), nullable=True),
+        sa.Column("price", sa.String(length=50), nullable=True),
+        sa.Column("network", sa.String(length=50), nullable=True),
+        sa.Column("message_id", sa.Integer(), nullable=True),
+        sa.Column("id", sa.INTEGER(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+        ),
+        sa.ForeignKeyConstraint(
+            ["message_id"],
+            ["correspondence_message.id"],
+            name=op.f("correspondence_message_status_message_id_fkey"),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("correspondence_message_status_pkey")),
+    )
+    op.create_unique_constraint(
+        "correspondence_message_status_provider_id_key",
+        "correspondence_message_status",
+        ["provider_id"],
+    )
+    op.create_index(
+        "ix_correspondence_message_status_message_id",
+        "correspondence_message_status",
+        ["message_id"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("correspondence_message_status")
@@ -0,0 +1,47 @@
+"""outbox
+
+Revision ID: 0e4d9b2a7f13
+Revises: a81f3c6d2e57
+Create Date: 2026-10-18 14:26:05.551207
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy import func
+
+# revision identifiers, used by Alembic.
+revision = "0e4d9b2a7f13"
+down_revision = "a81f3c6d2e57"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "correspondence_outbox",
+        sa.Column("message_id", sa.Integer(), nullable=False),
+        sa.Column("id", sa.INTEGER(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=func.now(),
+        ),
+        sa.ForeignKeyConstraint(
+            ["message_id"],
+            ["correspondence_message.id"],
+            name=op.f("correspondence_outbox_message_id_fkey"),
+        ),
+        sa.PrimaryKeyConstraint("id", name=op.f("correspondence_outbox_pkey")),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("correspondence_outbox")
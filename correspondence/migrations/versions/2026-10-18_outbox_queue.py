@@ -0,0 +1,32 @@
+"""outbox queue
+
+Revision ID: 7b3a5e91c0d2
+Revises: 0e4d9b2a7f13
+Create Date: 2026-10-18 16:48:19.730164
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7b3a5e91c0d2"
+down_revision = "0e4d9b2a7f13"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "correspondence_outbox",
+        sa.Column(
+            "queue",
+            sa.String(length=100),
+            server_default="correspondence:interactive",
+            nullable=False,
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("correspondence_outbox", "queue")
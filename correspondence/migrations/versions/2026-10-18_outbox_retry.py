@@ -0,0 +1,32 @@
+"""outbox retry
+
+Revision ID: 4e1b8c3d7a92
+Revises: 2b7c9e1f6a08
+Create Date: 2026-10-18 23:12:41.418203
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "4e1b8c3d7a92"
+down_revision = "2b7c9e1f6a08"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "correspondence_outbox",
+        sa.Column("available_at", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.add_column(
+        "correspondence_outbox",
+        sa.Column("attempt", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("correspondence_outbox", "attempt")
+    op.drop_column("correspondence_outbox", "available_at")
@@ -0,0 +1,27 @@
+"""phone number rate limit
+
+Revision ID: 6f2a8d0b3e74
+Revises: 9c1e7f4a5d26
+Create Date: 2026-10-18 20:37:12.906851
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "6f2a8d0b3e74"
+down_revision = "9c1e7f4a5d26"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "correspondence_phone_number",
+        sa.Column("rate_limit", sa.Float(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("correspondence_phone_number", "rate_limit")
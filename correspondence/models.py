@@ -1,23 +1,31 @@
-import asyncio
+import dataclasses
+import hashlib
+import json
 import random
 from collections import defaultdict
-from datetime import datetime
-from typing import Any, Optional, Self
+from datetime import datetime, timedelta
+from typing import Any, Optional, Self, Sequence
 
 import bcrypt
-from sqlalchemy import (INTEGER, TIMESTAMP, Boolean, ForeignKey, Integer,
-                        String, Text, event)
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import (INTEGER, TIMESTAMP, Boolean, Float, ForeignKey, Index,
+                        Integer, String, Text, and_, or_, tuple_)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import (Mapped, Session, joinedload, mapped_column,
-                            relationship, selectinload)
+from sqlalchemy.orm import (Mapped, aliased, joinedload, mapped_column,
+                            relationship, selectinload, validates)
 from sqlalchemy_searchable import search
 from sqlalchemy_utils import Country, CountryType, TSVectorType
 
+from correspondence.conf import Queue
 from correspondence.db.models import Model
-from correspondence.db.sql import select
+from correspondence.db.sql import (Select, func, insert, literal, select, text,
+                                   update)
+from correspondence.encoding import count_segments
 from correspondence.pagination import QueryPaginationParams, paginate
-from correspondence.provider import Provider
+from correspondence.personalization import (FIELDS, Template, compile_template,
+                                            validate_body)
+from correspondence.provider import MessageResult, Provider
+from correspondence.utils import utc_now
 
 
 class User(Model):
@@ -151,6 +159,7 @@ class User(Model):
         sender: "Optional[User]" = None,
         manager: "Optional[User]" = None,
         extra_data: dict[str, Any] | None = None,
+        send_at: datetime | None = None,
     ) -> "Message":
         async with asession.begin_nested():
             conversation, _ = await self.get_or_create_conversation(asession)
@@ -163,6 +172,7 @@ class User(Model):
                 body,
                 send=send,
                 extra_data=extra_data,
+                send_at=send_at,
             )
 
             return message
@@ -182,6 +192,119 @@ class User(Model):
 
         return await paginate(asession, User.id, query, pagination)
 
+    @classmethod
+    def filter(
+        cls,
+        organization_id: int | None = None,
+        is_staff: bool | None = None,
+        manager_id: int | None = None,
+        country: str | None = None,
+        q: str | None = None,
+    ) -> Select[tuple[Self]]:
+        query = select(cls)
+        if organization_id is not None:
+            query = query.where(cls.organization_id == organization_id)
+        if is_staff is not None:
+            query = query.where(cls.is_staff.is_(is_staff))
+        if manager_id is not None:
+            query = query.where(cls.manager_id == manager_id)
+        if country:
+            query = query.where(cls.country == country)
+        if q:
+            query = search(query, q)
+
+        return query
+
+    @classmethod
+    async def get_from_phone_number(
+        cls, asession: AsyncSession, organization_id: int, phone_number: str
+    ) -> Self | None:
+        return await cls.repository(asession).aget_by(
+            filter_by={
+                "organization_id": organization_id,
+                "phone_number": phone_number,
+            },
+            options=[joinedload(cls.manager)],
+        )
+
+    @classmethod
+    async def asplit_conflicts(
+        cls, asession: AsyncSession, contacts: Sequence[dict[str, Any]]
+    ) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+        """
+        Split contacts upserted by phone number from those which would create
+        a user with the email or active campaign id of another user, or of a
+        previous contact: both are unique and would abort the whole insert.
+        """
+        keys = ("email", "active_campaign_id")
+        values = {
+            key: {contact[key] for contact in contacts if contact.get(key) is not None}
+            for key in keys
+        }
+
+        rows = await asession.execute(
+            select(cls.phone_number, cls.email, cls.active_campaign_id).where(
+                or_(
+                    cls.phone_number.in_(
+                        [contact["phone_number"] for contact in contacts]
+                    ),
+                    cls.email.in_(values["email"]),
+                    cls.active_campaign_id.in_(values["active_campaign_id"]),
+                )
+            )
+        )
+        existing: set[str | None] = set()
+        taken: dict[str, set[str | None]] = {key: set() for key in keys}
+        for phone_number, email, active_campaign_id in rows:
+            existing.add(phone_number)
+            taken["email"].add(email)
+            taken["active_campaign_id"].add(active_campaign_id)
+
+        accepted: list[dict[str, Any]] = []
+        conflicts: list[dict[str, Any]] = []
+        for contact in contacts:
+            # existing users are left untouched, only new ones can conflict
+            if contact["phone_number"] in existing:
+                accepted.append(contact)
+                continue
+
+            if any(
+                contact.get(key) is not None and contact[key] in taken[key]
+                for key in keys
+            ):
+                conflicts.append(contact)
+                continue
+
+            accepted.append(contact)
+            for key in keys:
+                if contact.get(key) is not None:
+                    taken[key].add(contact[key])
+
+        return accepted, conflicts
+
+    @classmethod
+    async def get_many_from_phone_numbers(
+        cls, asession: AsyncSession, keys: list[tuple[int, str]]
+    ) -> dict[tuple[int, str], Self]:
+        """
+        Users by (organization id, phone number), with a single query.
+        """
+        if not keys:
+            return {}
+
+        query = (
+            select(cls)
+            .where(tuple_(cls.organization_id, cls.phone_number).in_(set(keys)))
+            .options(joinedload(cls.manager))
+        )
+        users = (await asession.scalars(query)).unique()
+
+        return {
+            (user.organization_id, user.phone_number): user
+            for user in users
+            if user.phone_number is not None
+        }
+
     def set_password(self, password: str):
         hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
 
@@ -239,6 +362,8 @@ class PhoneNumber(Model):
     number: Mapped[str] = mapped_column(String(255))
     country: Mapped[Country] = mapped_column(CountryType)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    # messages per second accepted by the carrier for this number
+    rate_limit: Mapped[float | None] = mapped_column(Float, nullable=True)
 
     organization_id: Mapped[int] = mapped_column(
         Integer,
@@ -294,6 +419,13 @@ class MessagePart(Model):
     )
 
 
+@dataclasses.dataclass
+class AutoMessageResult:
+    messages: Sequence["Message"] = ()
+    # contacts not sent, their email or active campaign id is another user's
+    conflicts: list[dict[str, Any]] = dataclasses.field(default_factory=list)
+
+
 class AutoMessage(Model):
     __abstract__ = False
     __tablename__ = "correspondence_automessage"
@@ -321,48 +453,225 @@ class AutoMessage(Model):
         lazy="raise",
     )
 
+    # seconds to wait before sending, spreads campaigns over time
+    delay: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
     async def send_message(
         self,
         asession: AsyncSession,
-        provider: Provider,
         phone_number: str,
         defaults: dict[str, Any] | None = None,
+        commit: bool = True,
     ) -> "Optional[Message]":
-        defaults = defaults or {}
-        user = await User.repository(asession).aget_by(
-            filter_by={"phone_number": phone_number}, options=[joinedload(User.manager)]
+        # a few statements whether the user and conversation exist or not,
+        # None when the automessage was already sent in the conversation or
+        # the contact conflicts with another user
+        result = await self.asend_many(
+            asession, [{**(defaults or {}), "phone_number": phone_number}]
         )
-        async with asession.begin_nested():
-            if not user:
-                user = User(
-                    phone_number=phone_number,
-                    manager=self.sender,
-                    manager_id=self.sender.id,
-                    organization_id=self.organization_id,
-                    **defaults,
-                )
 
-                await user.asave(asession)
+        if commit and not asession.in_nested_transaction():
+            await asession.commit()
 
-            if await user.has_automessage(asession, self):
-                return None
+        return result.messages[0] if result.messages else None
 
-            await asession.flush()
+    @validates("body")
+    def validate_placeholders(self, key: str, body: str) -> str:
+        return validate_body(body)
 
-            message = await user.create_message(
-                asession,
-                self.body,
-                sender=self.sender,
-                manager=self.sender,
-                extra_data={"automessage_id": self.id},
+    @property
+    def template(self) -> Template:
+        return compile_template(self.body)
+
+    def get_send_at(self) -> datetime | None:
+        if not self.delay:
+            return None
+
+        return utc_now() + timedelta(seconds=self.delay)
+
+    async def asend_many(
+        self, asession: AsyncSession, contacts: Sequence[dict[str, Any]]
+    ) -> AutoMessageResult:
+        """
+        Send this automessage to many contacts with set-based statements: an
+        upsert of the users, an upsert of their conversations, then the
+        messages with their conversation update and outbox rows in a single
+        statement. Contacts which already received it are skipped thanks to
+        the unique (conversation_id, automessage_id) constraint. Contacts
+        conflicting with other users are returned instead of being sent.
+
+        Contacts are dicts of user values, `phone_number` is required and
+        only used to look up existing users.
+        """
+        # ON CONFLICT DO UPDATE cannot affect a row twice in a statement
+        contacts = list(
+            {contact["phone_number"]: contact for contact in contacts}.values()
+        )
+        if not contacts:
+            return AutoMessageResult()
+
+        contacts, conflicts = await User.asplit_conflicts(asession, contacts)
+        if not contacts:
+            return AutoMessageResult(conflicts=conflicts)
+
+        now = utc_now()
+
+        # conflicting rows are "updated" to themselves so they are returned
+        users_query = insert(User).values(
+            [
+                {
+                    **contact,
+                    "manager_id": self.sender_id,
+                    "organization_id": self.organization_id,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for contact in contacts
+            ]
+        )
+        upsert_users = users_query.on_conflict_do_update(
+            index_elements=[User.phone_number],
+            set_={"phone_number": users_query.excluded.phone_number},
+        ).returning(User.id)
+        user_ids = list(await asession.scalars(upsert_users))
+
+        return AutoMessageResult(
+            messages=await self.asend_to_users(asession, user_ids),
+            conflicts=conflicts,
+        )
+
+    async def asend_to_users(
+        self, asession: AsyncSession, user_ids: Sequence[int]
+    ) -> Sequence["Message"]:
+        """
+        Send this automessage to existing users, with the conversation and
+        message statements of `asend_many`.
+        """
+        if not user_ids:
+            return []
+
+        now = utc_now()
+
+        # the sending number is picked among the active numbers of the
+        # organization in the receiver's country
+        phone_number_id = (
+            select(PhoneNumber.id)
+            .where(
+                PhoneNumber.organization_id == User.organization_id,
+                PhoneNumber.country == User.country,
+                PhoneNumber.is_active.is_(True),
+            )
+            .order_by(func.random())
+            .limit(1)
+            .correlate(User)
+            .scalar_subquery()
+        )
+        conversations_query = insert(Conversation).from_select(
+            [
+                "receiver_id",
+                "organization_id",
+                "phone_number_id",
+                "created_at",
+                "updated_at",
+            ],
+            select(
+                User.id,
+                User.organization_id,
+                phone_number_id,
+                literal(now, TIMESTAMP(timezone=True)),
+                literal(now, TIMESTAMP(timezone=True)),
+            ).where(User.id.in_(list(user_ids))),
+        )
+        upsert_conversations = conversations_query.on_conflict_do_update(
+            index_elements=[Conversation.receiver_id],
+            set_={"receiver_id": conversations_query.excluded.receiver_id},
+        ).returning(Conversation.id)
+        conversation_ids = list(await asession.scalars(upsert_conversations))
+
+        send_at = self.get_send_at()
+        scheduled = send_at is not None
+
+        inserted = (
+            insert(Message)
+            .from_select(
+                [
+                    "sender_id",
+                    "conversation_id",
+                    "automessage_id",
+                    "body",
+                    "organization_id",
+                    "status",
+                    "send_at",
+                    "created_at",
+                    "updated_at",
+                ],
+                select(
+                    literal(self.sender_id),
+                    Conversation.id,
+                    literal(self.id),
+                    # personalised bodies are rendered by Postgres
+                    self.template.as_sql(
+                        {field: getattr(User, field) for field in FIELDS}
+                    ),
+                    User.organization_id,
+                    literal(
+                        Message.STATUS_SCHEDULED if scheduled else Message.STATUS_QUEUED
+                    ),
+                    literal(send_at, TIMESTAMP(timezone=True)),
+                    literal(now, TIMESTAMP(timezone=True)),
+                    literal(now, TIMESTAMP(timezone=True)),
+                )
+                .join(User, User.id == Conversation.receiver_id)
+                .where(Conversation.id.in_(conversation_ids)),
             )
+            .on_conflict_do_nothing(
+                index_elements=[Message.conversation_id, Message.automessage_id]
+            )
+            .returning(*Message.__table__.c)
+            .cte("inserted")
+        )
 
-            return message
+        conversations = (
+            update(Conversation)
+            .where(Conversation.id == inserted.c.conversation_id)
+            .values(
+                messages_count=Conversation.messages_count + 1,
+                last_message_id=inserted.c.id,
+                last_message_at=inserted.c.created_at,
+                updated_at=now,
+            )
+            .cte("conversations")
+        )
+
+        messages_query = select(aliased(Message, inserted)).add_cte(conversations)
+
+        if not scheduled:
+            outbox = insert(OutboxMessage).from_select(
+                ["message_id", "queue", "created_at", "updated_at"],
+                select(
+                    inserted.c.id,
+                    # messages of automessages always go through the campaign lane
+                    literal(Queue.campaign.value),
+                    literal(now, TIMESTAMP(timezone=True)),
+                    literal(now, TIMESTAMP(timezone=True)),
+                ),
+            )
+            messages_query = messages_query.add_cte(outbox.cte("outbox"))
+
+        return list(await asession.scalars(messages_query))
 
 
 class Message(Model):
     __abstract__ = False
     __tablename__ = "correspondence_message"
+    __table_args__ = (
+        # only scheduled messages are scanned by the scheduler
+        Index(
+            "correspondence_message_send_at_idx",
+            "send_at",
+            postgresql_where=text("status = 'scheduled'"),
+        ),
+    )
 
     sender_id: Mapped[int] = mapped_column(
         Integer,
@@ -412,48 +721,508 @@ class Message(Model):
 
     provider_ids: Mapped[list[str]] = mapped_column(ARRAY(String(255)), nullable=True)
 
-    async def async_send(self):
-        from correspondence.broker import message_sent
+    segments_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+
+    status: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    send_at: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+
+    STATUS_SCHEDULED = "scheduled"
+    STATUS_QUEUED = "queued"
+
+    @property
+    def queue(self) -> Queue:
+        # automated campaigns must never delay replies sent by an agent
+        if self.automessage_id:
+            return Queue.campaign
 
-        await message_sent.kiq(self.id)
+        return Queue.interactive
 
-    async def send(
+    async def get_from_phone_number(
         self,
         asession: AsyncSession,
+        supported_countries: dict[int, defaultdict[str, "list[PhoneNumber]"]]
+        | None = None,
+    ) -> "Optional[PhoneNumber]":
+        phone_number = self.conversation.phone_number
+        if self.conversation.phone_number_id and phone_number.is_active:
+            return phone_number
+
+        # supported countries can be shared between messages of a same batch
+        if supported_countries is None:
+            supported_countries = {}
+        if self.organization_id not in supported_countries:
+            supported_countries[
+                self.organization_id
+            ] = await Organization.get_supported_countries(
+                asession, self.organization_id
+            )
+
+        countries = supported_countries[self.organization_id]
+        if not self.sender.country or self.sender.country.code not in countries:
+            return None
+
+        from_ph = random.choices(countries[self.sender.country.code])[0]
+
+        await self.conversation.aupdate(asession, phone_number_id=from_ph.id)
+
+        return from_ph
+
+    @classmethod
+    async def aget_for_sending(
+        cls, asession: AsyncSession, message_ids: list[int]
+    ) -> Sequence["Message"]:
+        # messages with provider ids have already been sent
+        query = (
+            select(cls)
+            .where(cls.id.in_(message_ids), cls.provider_ids.is_(None))
+            .options(
+                joinedload(cls.sender),
+                joinedload(cls.conversation).options(
+                    joinedload(Conversation.receiver),
+                    joinedload(Conversation.phone_number),
+                ),
+            )
+        )
+
+        return await cls.repository(asession).aget_all(query)
+
+    @classmethod
+    async def asend_many(
+        cls,
+        asession: AsyncSession,
         provider: Provider,
-        commit: bool = True,
+        messages: Sequence["Message"],
+    ) -> dict[int, MessageResult]:
+        results = await cls.asend_to_provider(asession, provider, messages)
+        await cls.arecord_sent(asession, messages, results)
+
+        return results
+
+    @classmethod
+    async def asend_to_provider(
+        cls,
+        asession: AsyncSession,
+        provider: Provider,
+        messages: Sequence["Message"],
+    ) -> dict[int, MessageResult]:
+        results: dict[int, MessageResult] = {}
+        supported_countries: dict[int, defaultdict[str, list[PhoneNumber]]] = {}
+
+        sendable: list[tuple["Message", PhoneNumber]] = []
+        for message in messages:
+            results[message.id] = MessageResult()
+
+            from_ph = await message.get_from_phone_number(asession, supported_countries)
+            if from_ph and message.conversation.receiver.phone_number:
+                sendable.append((message, from_ph))
+                provider.sender_rate_limiter.set_rate(
+                    from_ph.number, from_ph.rate_limit
+                )
+
+        batch_results = await provider.create_messages(
+            [
+                (
+                    from_ph.number,
+                    message.conversation.receiver.phone_number,  # type: ignore
+                    message.body,
+                )
+                for message, from_ph in sendable
+            ]
+        )
+
+        for (message, _), result in zip(sendable, batch_results):
+            results[message.id] = result
+
+        return results
+
+    @classmethod
+    async def arecord_sent(
+        cls,
+        asession: AsyncSession,
+        messages: Sequence["Message"],
+        results: dict[int, MessageResult],
     ) -> None:
-        receiver = self.conversation.receiver
-
-        from_ph = None
-        if (
-            not self.conversation.phone_number_id
-            or not self.conversation.phone_number.is_active
-        ):
-            supported_countries = await Organization.get_supported_countries(
-                asession, self.organization_id
+        values: list[dict[str, Any]] = []
+        provider_ids: dict[int, list[str]] = {}
+        for message in messages:
+            result = results.get(message.id)
+            if result is None or not result.provider_ids:
+                continue
+
+            provider_ids[message.id] = result.provider_ids
+            values.append(
+                {
+                    "id": message.id,
+                    "provider_ids": result.provider_ids,
+                    "segments_count": count_segments(message.body),
+                }
+            )
+
+        if values:
+            # ORM bulk UPDATE by primary key, a single executemany
+            await asession.execute(update(cls), values)
+
+        await MessageStatus.atrack_many(asession, provider_ids)
+
+    @classmethod
+    async def aclaim_scheduled(
+        cls, asession: AsyncSession, limit: int, now: datetime | None = None
+    ) -> Sequence[Self]:
+        query = (
+            select(cls)
+            .where(
+                cls.status == cls.STATUS_SCHEDULED,
+                cls.send_at <= (now or utc_now()),
+            )
+            .order_by(cls.send_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+
+        return await cls.repository(asession).aget_all(query)
+
+
+class MessageStatus(Model):
+    __abstract__ = False
+    __tablename__ = "correspondence_message_status"
+
+    provider_id: Mapped[str] = mapped_column(String(100), unique=True)
+    status: Mapped[str] = mapped_column(String(50))
+    error_code: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    price: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    network: Mapped[str | None] = mapped_column(String(50), nullable=True)
+
+    message_id: Mapped[int | None] = mapped_column(
+        Integer,
+        ForeignKey("correspondence_message.id"),
+        nullable=True,
+    )
+
+    message: Mapped["Optional[Message]"] = relationship(
+        foreign_keys=[message_id], viewonly=True, lazy="raise"
+    )
+
+    STATUS_SUBMITTED = "submitted"
+
+    @classmethod
+    async def atrack(
+        cls, asession: AsyncSession, message_id: int, provider_ids: list[str]
+    ) -> None:
+        await cls.atrack_many(asession, {message_id: provider_ids})
+
+    @classmethod
+    async def atrack_many(
+        cls, asession: AsyncSession, provider_ids: dict[int, list[str]]
+    ) -> None:
+        if not provider_ids:
+            return
+
+        # a receipt can be flushed before the message is saved, in that
+        # case only the message is attached to the existing status
+        now = utc_now()
+        query = insert(cls).values(
+            [
+                {
+                    "provider_id": provider_id,
+                    "message_id": message_id,
+                    "status": cls.STATUS_SUBMITTED,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for message_id, ids in provider_ids.items()
+                for provider_id in ids
+            ]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[cls.provider_id],
+            set_={"message_id": query.excluded.message_id},
+        )
+        await asession.execute(query)
+
+    @classmethod
+    async def abulk_upsert(
+        cls, asession: AsyncSession, statuses: list[dict[str, Any]]
+    ) -> None:
+        if not statuses:
+            return
+
+        now = utc_now()
+        query = insert(cls).values(
+            [{**status, "created_at": now, "updated_at": now} for status in statuses]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[cls.provider_id],
+            set_={
+                "status": query.excluded.status,
+                "error_code": query.excluded.error_code,
+                "price": query.excluded.price,
+                "network": query.excluded.network,
+                "updated_at": query.excluded.updated_at,
+            },
+        )
+        await asession.execute(query)
+
+
+class OutboxMessage(Model):
+    __abstract__ = False
+    __tablename__ = "correspondence_outbox"
+
+    message_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("correspondence_message.id"),
+        nullable=False,
+    )
+
+    message: Mapped[Message] = relationship(
+        foreign_keys=[message_id], viewonly=True, lazy="raise"
+    )
+
+    queue: Mapped[str] = mapped_column(
+        String(100), server_default=Queue.interactive.value
+    )
+
+    # retries wait here until they are available
+    available_at: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    attempt: Mapped[int] = mapped_column(Integer, server_default="0")
+
+    @classmethod
+    async def aclaim(cls, asession: AsyncSession, limit: int) -> Sequence[Self]:
+        # rows locked by another dispatcher are skipped, not waited for
+        query = (
+            select(cls)
+            .where(or_(cls.available_at.is_(None), cls.available_at <= utc_now()))
+            .order_by(cls.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+
+        return await cls.repository(asession).aget_all(query)
+
+    @classmethod
+    async def aadd_many(
+        cls, asession: AsyncSession, messages: Sequence[Message]
+    ) -> None:
+        if not messages:
+            return
+
+        now = utc_now()
+        await asession.execute(
+            insert(cls).values(
+                [
+                    {
+                        "message_id": message.id,
+                        "queue": message.queue.value,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for message in messages
+                ]
             )
-            if self.sender.country and self.sender.country.code in supported_countries:
-                from_ph = random.choices(supported_countries[self.sender.country.code])[
-                    0
+        )
+
+    @classmethod
+    async def aretry_many(
+        cls,
+        asession: AsyncSession,
+        message_ids: Sequence[int],
+        queue: str,
+        attempt: int,
+        delay: float,
+    ) -> None:
+        if not message_ids:
+            return
+
+        now = utc_now()
+        await asession.execute(
+            insert(cls).values(
+                [
+                    {
+                        "message_id": message_id,
+                        "queue": queue,
+                        "attempt": attempt,
+                        "available_at": now + timedelta(seconds=delay),
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for message_id in message_ids
                 ]
+            )
+        )
 
-                await self.conversation.aupdate(asession, phone_number_id=from_ph.id)
-        else:
-            from_ph = self.conversation.phone_number
 
-        if not from_ph:
+class DeadLetter(Model):
+    __abstract__ = False
+    __tablename__ = "correspondence_dead_letter"
+
+    # digest of the task name and arguments, the same task failing again is a
+    # new attempt; arguments can be a whole batch, too large for an index
+    key: Mapped[str] = mapped_column(Text, unique=True)
+    task_name: Mapped[str] = mapped_column(String(255), index=True)
+    args: Mapped[list[Any]] = mapped_column(JSONB, server_default="[]")
+    kwargs: Mapped[dict[str, Any]] = mapped_column(JSONB, server_default="{}")
+    labels: Mapped[dict[str, Any]] = mapped_column(JSONB, server_default="{}")
+    error: Mapped[str] = mapped_column(Text)
+    attempts: Mapped[int] = mapped_column(Integer, server_default="1")
+    replayed_at: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+
+    @classmethod
+    def get_key(cls, task_name: str, args: Sequence[Any]) -> str:
+        return hashlib.sha256(
+            f"{task_name}:{json.dumps(list(args), sort_keys=True)}".encode()
+        ).hexdigest()
+
+    @classmethod
+    async def arecord_many(
+        cls, asession: AsyncSession, dead_letters: list[dict[str, Any]]
+    ) -> None:
+        if not dead_letters:
             return
 
-        if receiver.phone_number and (
-            provider_ids := await provider.create_message(
-                from_ph.number, receiver.phone_number, self.body
+        now = utc_now()
+        query = insert(cls).values(
+            [
+                {
+                    "key": cls.get_key(dead_letter["task_name"], dead_letter["args"]),
+                    "kwargs": {},
+                    "labels": {},
+                    **dead_letter,
+                    "attempts": 1,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                for dead_letter in dead_letters
+            ]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[cls.key],
+            set_={
+                "kwargs": query.excluded.kwargs,
+                "labels": query.excluded.labels,
+                "error": query.excluded.error,
+                "attempts": cls.attempts + 1,
+                "replayed_at": None,
+                "updated_at": query.excluded.updated_at,
+            },
+        )
+        await asession.execute(query)
+
+    @classmethod
+    def filter(
+        cls,
+        task_name: str | None = None,
+        error: str | None = None,
+        since: datetime | None = None,
+        replayed: bool = False,
+    ) -> Select[tuple[Self]]:
+        query = select(cls)
+        if task_name:
+            query = query.where(cls.task_name == task_name)
+        if error:
+            query = query.where(cls.error.ilike(f"%{error}%"))
+        if since:
+            query = query.where(cls.updated_at >= since)
+        if not replayed:
+            query = query.where(cls.replayed_at.is_(None))
+
+        return query
+
+
+class Broadcast(Model):
+    __abstract__ = False
+    __tablename__ = "correspondence_broadcast"
+
+    automessage_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("correspondence_automessage.id"),
+        nullable=False,
+    )
+
+    automessage: Mapped[AutoMessage] = relationship(
+        foreign_keys=[automessage_id], viewonly=True, lazy="raise"
+    )
+
+    organization_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("correspondence_organization.id"),
+        nullable=False,
+    )
+
+    # keyword arguments of User.filter
+    filters: Mapped[dict[str, Any]] = mapped_column(JSONB, server_default="{}")
+
+    status: Mapped[str] = mapped_column(String(50), server_default="pending")
+    # checkpoint: users are processed in id order, up to this one included
+    last_user_id: Mapped[int] = mapped_column(Integer, server_default="0")
+    total_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    processed_count: Mapped[int] = mapped_column(Integer, server_default="0")
+    created_count: Mapped[int] = mapped_column(Integer, server_default="0")
+    finished_at: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    @classmethod
+    async def aclaim(
+        cls, asession: AsyncSession, broadcast_id: int, stale_after: timedelta
+    ) -> Self | None:
+        """
+        Mark a broadcast as running, unless it is done or another run updated
+        it less than `stale_after` ago: runs update it with every batch, a
+        run which stopped doing so is considered dead.
+        """
+        now = utc_now()
+        query = (
+            update(cls)
+            .where(
+                cls.id == broadcast_id,
+                or_(
+                    cls.status.not_in([cls.STATUS_RUNNING, cls.STATUS_DONE]),
+                    and_(
+                        cls.status == cls.STATUS_RUNNING,
+                        cls.updated_at < now - stale_after,
+                    ),
+                ),
             )
-        ):
-            self.provider_ids = provider_ids
+            .values(status=cls.STATUS_RUNNING, updated_at=now)
+            .returning(cls)
+            .execution_options(populate_existing=True)
+        )
+
+        return (await asession.scalars(query)).one_or_none()
+
+    def get_users_query(self) -> Select[tuple[User]]:
+        return User.filter(organization_id=self.organization_id, **self.filters).where(
+            User.phone_number.is_not(None)
+        )
 
-        if commit is True:
-            await self.asave(asession)
+    async def acount_users(self, asession: AsyncSession) -> int:
+        query = select(func.count()).select_from(
+            self.get_users_query().with_only_columns(User.id).subquery()
+        )
+
+        return await asession.scalar(query) or 0
+
+    async def anext_user_ids(self, asession: AsyncSession, limit: int) -> Sequence[int]:
+        # keyset pagination from the checkpoint, stable while users are added
+        query = (
+            self.get_users_query()
+            .with_only_columns(User.id)
+            .where(User.id > self.last_user_id)
+            .order_by(User.id)
+            .limit(limit)
+        )
+
+        return list(await asession.scalars(query))
 
 
 class Organization(Model):
@@ -575,10 +1344,7 @@ class Organization(Model):
     async def get_user_from_phone_number(
         self, asession: AsyncSession, phone_number: str
     ) -> "Optional[User]":
-        return await User.repository(asession).aget_by(
-            filter_by={"organization_id": self.id, "phone_number": phone_number},
-            options=[joinedload(User.manager)],
-        )
+        return await User.get_from_phone_number(asession, self.id, phone_number)
 
 
 class Conversation(Model):
@@ -699,7 +1465,11 @@ class Conversation(Model):
         send: bool = True,
         extra_data: dict[str, Any] | None = None,
         commit: bool = True,
+        send_at: datetime | None = None,
     ) -> Message:
+        # messages due in the future are left to the scheduler
+        scheduled = send and send_at is not None and send_at > utc_now()
+
         async with asession.begin_nested():
             extra_data = extra_data or {}
             message = Message(
@@ -709,19 +1479,23 @@ class Conversation(Model):
                 conversation_id=self.id,
                 conversation=self,
                 organization_id=self.receiver.organization_id,
+                send_at=send_at,
                 **extra_data,
             )
+            if scheduled:
+                message.status = Message.STATUS_SCHEDULED
+            elif send:
+                message.status = Message.STATUS_QUEUED
 
             await message.asave(asession, commit=commit)
             await asession.flush()
             await self.compute(asession, last_message=message, commit=commit)
 
-        if send:
-
-            @event.listens_for(asession.sync_session, "after_commit", once=True)
-            def after_commit(session: Session):
-                loop = asyncio.get_running_loop()
-                loop.create_task(message.async_send())
+            if send and not scheduled:
+                # enqueued by the outbox dispatcher once this transaction commits
+                await OutboxMessage.repository(asession).acreate(
+                    message_id=message.id, queue=message.queue.value, commit=False
+                )
 
         return message
 
@@ -739,6 +1513,10 @@ class Conversation(Model):
 __all__ = [
     "User",
     "MessagePart",
+    "MessageStatus",
+    "OutboxMessage",
+    "DeadLetter",
+    "Broadcast",
     "Conversation",
     "AutoMessage",
     "Organization",
@@ -0,0 +1,83 @@
+import asyncio
+from collections import defaultdict
+
+import structlog
+
+from correspondence.db.engine import AsyncSession, DatabaseEngine
+
+logger = structlog.get_logger("outbox")
+
+
+class OutboxDispatcher:
+    """
+    Moves messages from the outbox table to the broker: pending rows are
+    claimed in batches with FOR UPDATE SKIP LOCKED, enqueued, then deleted
+    in the same transaction. A crash before the commit releases the rows,
+    which are enqueued again (at-least-once delivery). Retries of failed
+    sends wait in the outbox until their `available_at`.
+    """
+
+    def __init__(
+        self, db: DatabaseEngine, batch_size: int = 500, poll_interval: float = 0.5
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.task: asyncio.Task | None = None
+
+    async def enqueue(
+        self, queue: str, message_ids: list[int], attempt: int = 0
+    ) -> None:
+        from correspondence.broker import messages_sent
+
+        await (
+            messages_sent.kicker()
+            .with_labels(queue_name=queue)
+            .kiq(message_ids, attempt=attempt)
+        )
+
+    async def dispatch(self, asession: AsyncSession) -> int:
+        from correspondence.models import OutboxMessage
+
+        rows = await OutboxMessage.aclaim(asession, self.batch_size)
+        if not rows:
+            return 0
+
+        queues: dict[tuple[str, int], list[int]] = defaultdict(list)
+        for row in rows:
+            queues[(row.queue, row.attempt)].append(row.message_id)
+
+        for (queue, attempt), message_ids in queues.items():
+            await self.enqueue(queue, message_ids, attempt=attempt)
+
+        await OutboxMessage.repository(asession).abulk_delete(
+            clauses=[OutboxMessage.id.in_([row.id for row in rows])]
+        )
+
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                async with self.db.async_session_local() as asession:
+                    count = await self.dispatch(asession)
+                    await asession.commit()
+            except Exception:
+                logger.exception("unable to dispatch outbox")
+                count = 0
+
+            if count:
+                logger.debug("outbox dispatched", count=count)
+
+            # a full batch means more rows are probably waiting
+            if count < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def startup(self) -> None:
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def shutdown(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
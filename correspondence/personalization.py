@@ -0,0 +1,91 @@
+import dataclasses
+import re
+from functools import lru_cache
+from typing import Any, Mapping
+
+from sqlalchemy import ColumnElement, String
+
+from correspondence.db.sql import func, literal
+
+PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# user attributes available in automessage bodies, e.g. {{ first_name }}
+FIELDS = ("first_name", "last_name", "email", "phone_number")
+
+
+@dataclasses.dataclass(frozen=True)
+class Template:
+    """
+    A body split once into literal parts and field names: rendering is a
+    join, and the same parts build a SQL expression so bodies can be
+    rendered by Postgres in set-based inserts.
+    """
+
+    # literal text or field name, alternately, starting with literal text
+    parts: tuple[str, ...]
+
+    @property
+    def fields(self) -> tuple[str, ...]:
+        return self.parts[1::2]
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        return "".join(
+            part if i % 2 == 0 else str(values.get(part) or "")
+            for i, part in enumerate(self.parts)
+        )
+
+    def as_sql(self, columns: Mapping[str, ColumnElement[Any]]) -> ColumnElement[str]:
+        if not self.fields:
+            return literal(self.parts[0], String)
+
+        return func.concat(
+            *[
+                literal(part, String) if i % 2 == 0 else columns[part]
+                for i, part in enumerate(self.parts)
+                if part
+            ]
+        )
+
+
+def validate_body(body: str) -> str:
+    """
+    Reject placeholders which are not user attributes, e.g. a misspelled
+    {{ frist_name }} would be sent verbatim.
+    """
+    unknown = sorted(
+        {
+            match.group(1)
+            for match in PLACEHOLDER.finditer(body)
+            if match.group(1) not in FIELDS
+        }
+    )
+    if unknown:
+        raise ValueError(
+            f"unknown placeholders: {', '.join(unknown)}, "
+            f"available: {', '.join(FIELDS)}"
+        )
+
+    return body
+
+
+@lru_cache(maxsize=1024)
+def compile_template(body: str) -> Template:
+    """
+    Compile a body, cached by its text: an edited automessage body is a new
+    revision and compiled once again.
+    """
+    parts: list[str] = []
+    position = 0
+    for match in PLACEHOLDER.finditer(body):
+        # unknown placeholders are kept verbatim, bodies saved before they
+        # were rejected may contain some
+        if match.group(1) not in FIELDS:
+            continue
+
+        parts.append(body[position : match.start()])
+        parts.append(match.group(1))
+        position = match.end()
+
+    parts.append(body[position:])
+
+    return Template(tuple(parts))
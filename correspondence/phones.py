@@ -0,0 +1,44 @@
+import dataclasses
+from functools import lru_cache
+from typing import Iterable
+
+import phonenumbers
+from phonenumbers.phonenumberutil import NumberParseException
+
+from correspondence.conf import settings
+
+
+@dataclasses.dataclass(frozen=True)
+class NormalizedPhoneNumber:
+    e164: str | None = None
+    region: str | None = None
+    valid: bool = False
+
+
+# parsing and validating against the phone number metadata is expensive and
+# the same numbers come back again and again (retries, campaigns)
+@lru_cache(maxsize=settings.PHONE_NUMBER_CACHE_SIZE)
+def normalize(raw: str, region: str | None = None) -> NormalizedPhoneNumber:
+    try:
+        phone_number = phonenumbers.parse(raw, region or settings.DEFAULT_COUNTRY)
+    except NumberParseException:
+        return NormalizedPhoneNumber()
+
+    return NormalizedPhoneNumber(
+        e164=phonenumbers.format_number(
+            phone_number, phonenumbers.PhoneNumberFormat.E164
+        ),
+        region=phonenumbers.region_code_for_number(phone_number),
+        valid=phonenumbers.is_valid_number(phone_number),
+    )
+
+
+def normalize_many(
+    raws: Iterable[str], region: str | None = None
+) -> list[NormalizedPhoneNumber]:
+    raws = list(raws)
+
+    # duplicates of a batch are only looked up once
+    results = {raw: normalize(raw, region) for raw in dict.fromkeys(raws)}
+
+    return [results[raw] for raw in raws]
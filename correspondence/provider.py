@@ -1,22 +1,110 @@
-from typing import Any, Optional
+import asyncio
+import dataclasses
+from typing import Any, Optional, Sequence
 
 import httpx
+import structlog
 from fastapi import status
 from pydantic import BaseModel, Field
 
+from correspondence import encoding
+from correspondence.circuitbreaker import CircuitBreaker
+from correspondence.ratelimit import (RateLimited, RateLimiter,
+                                      SenderRateLimiter)
+
+logger = structlog.get_logger("provider")
+
+
+class ProviderError(Exception):
+    pass
+
+
+class ProviderThrottled(ProviderError):
+    # retried with backoff, the provider does not tell when to come back
+    retry_after: float = 0.0
+
+
+@dataclasses.dataclass
+class MessageResult:
+    provider_ids: list[str] | None = None
+    error: BaseException | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+MessageBatch = Sequence[tuple[str, str, str]]
+
 
 class Provider:
-    def __init__(self, **kw: Any) -> None:
+    concurrency: int = 10
+    rate_limiter: RateLimiter = RateLimiter()
+    sender_rate_limiter: SenderRateLimiter = SenderRateLimiter()
+
+    circuit_breaker: CircuitBreaker
+
+    def __init__(
+        self,
+        concurrency: int | None = None,
+        rate_limiter: RateLimiter | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        sender_rate_limiter: SenderRateLimiter | None = None,
+        **kw: Any,
+    ) -> None:
+        if concurrency is not None:
+            self.concurrency = concurrency
+        if rate_limiter is not None:
+            self.rate_limiter = rate_limiter
+        if sender_rate_limiter is not None:
+            self.sender_rate_limiter = sender_rate_limiter
+
+        self.circuit_breaker = circuit_breaker or CircuitBreaker(
+            self.__class__.__name__
+        )
+
+    async def startup(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
         pass
 
     async def create_message(self, from_: str, to: str, body: str) -> list[str] | None:
         raise NotImplementedError
 
+    async def create_messages(
+        self, batch: MessageBatch, concurrency: int | None = None
+    ) -> list[MessageResult]:
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def send(from_: str, to: str, body: str) -> MessageResult:
+            # paced per sending number before taking a slot, so messages
+            # waiting for a busy number do not hold back the other numbers
+            try:
+                await self.sender_rate_limiter.acquire(from_)
+            except RateLimited as exc:
+                return MessageResult(error=exc)
+
+            async with semaphore:
+                try:
+                    provider_ids = await self.create_message(from_, to, body)
+                except Exception as exc:
+                    return MessageResult(error=exc)
+
+                return MessageResult(provider_ids=provider_ids)
+
+        return await asyncio.gather(*[send(*item) for item in batch])
+
 
 class NoopProvider(Provider):
     async def create_message(self, from_: str, to: str, body: str) -> list[str] | None:
         return None
 
+    async def create_messages(
+        self, batch: MessageBatch, concurrency: int | None = None
+    ) -> list[MessageResult]:
+        return [MessageResult() for _ in batch]
+
 
 class NexmoMessageResponse(BaseModel):
     to: Optional[str] = None
@@ -40,10 +128,59 @@ class NexmoProvider(Provider):
     client: httpx.AsyncClient
     base_url = "https://rest.nexmo.com"
 
-    def __init__(self, account: str, token: str):
+    # https://developer.vonage.com/en/messaging/sms/guides/troubleshooting-sms
+    STATUS_THROTTLED = "1"
+
+    def __init__(
+        self,
+        account: str,
+        token: str,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        pool_timeout: float = 5.0,
+        http2: bool = False,
+        base_url: str | None = None,
+        **kw: Any,
+    ):
+        super().__init__(**kw)
+
         self.account = account
         self.token = token
-        self.client = httpx.AsyncClient()
+        if base_url:
+            self.base_url = base_url
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(
+            read_timeout,
+            connect=connect_timeout,
+            read=read_timeout,
+            pool=pool_timeout,
+        )
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.client = self.create_client()
+
+    def create_client(self) -> httpx.AsyncClient:
+        # http2 requires the optional "h2" package (httpx[http2])
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+        )
+
+    async def startup(self) -> None:
+        if self.client.is_closed:
+            self.client = self.create_client()
+
+    async def shutdown(self) -> None:
+        await self.client.aclose()
 
     async def post(self, path: str, payload: dict[str, Any]) -> httpx.Response:
         payload.update(
@@ -53,7 +190,42 @@ class NexmoProvider(Provider):
             }
         )
 
-        return await self.client.post(f"{self.base_url}{path}", json=payload)
+        self.circuit_breaker.before_call()
+
+        await self.rate_limiter.acquire()
+
+        try:
+            response = await self.client.post(path, json=payload)
+        except httpx.HTTPError:
+            self.circuit_breaker.record_failure()
+            raise
+
+        if response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+
+        if response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+            await self.rate_limiter.throttled()
+
+            raise ProviderThrottled(f"{path} throttled by provider")
+
+        return response
+
+    async def create_messages(
+        self, batch: MessageBatch, concurrency: int | None = None
+    ) -> list[MessageResult]:
+        # never schedule more in-flight requests than the pool can serve,
+        # extra ones would only wait on the pool timeout
+        concurrency = min(concurrency or self.concurrency, self.max_connections)
+
+        return await super().create_messages(batch, concurrency=concurrency)
+
+    def get_message_type(self, body: str) -> str:
+        if encoding.is_gsm7(body):
+            return "text"
+
+        return "unicode"
 
     async def create_message(self, from_: str, to: str, body: str) -> list[str] | None:
         response = await self.post(
@@ -62,17 +234,38 @@ class NexmoProvider(Provider):
                 "from": from_,
                 "to": to,
                 "text": body,
-                "type": "unicode",
+                "type": self.get_message_type(body),
             },
         )
 
-        assert response.status_code == status.HTTP_200_OK
+        if response.status_code != status.HTTP_200_OK:
+            raise ProviderError(
+                f"unexpected response from provider: {response.status_code}"
+            )
 
         body = response.json()
         sms_response = NexmoSmsResponse(**body)  # type: ignore
 
-        return [
+        provider_ids = [
             message.message_id
             for message in sms_response.messages
             if message.message_id
         ]
+
+        if any(
+            message.status == self.STATUS_THROTTLED for message in sms_response.messages
+        ):
+            await self.rate_limiter.throttled()
+
+            if not provider_ids:
+                raise ProviderThrottled(f"message to {to} throttled by provider")
+
+            # parts already accepted are delivered, sending the message again
+            # would duplicate them
+            logger.warning(
+                "message partially throttled by provider",
+                to=to,
+                provider_ids=provider_ids,
+            )
+
+        return provider_ids
@@ -0,0 +1,320 @@
+import asyncio
+import dataclasses
+from logging import getLogger
+from typing import Any, AsyncGenerator, cast
+
+from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+from taskiq import (AckableMessage, AsyncBroker, BrokerMessage, TaskiqMessage,
+                    TaskiqMiddleware, TaskiqResult)
+from taskiq_redis import ListQueueBroker, RedisStreamBroker
+
+logger = getLogger("correspondence.queues")
+
+
+@dataclasses.dataclass
+class Lane:
+    queue_name: str
+    # maximum number of tasks of this lane running at once in a worker
+    concurrency: int
+    # minimum share of dequeues guaranteed to this lane when it has work
+    min_share: float = 0.0
+
+    credit: float = 0.0
+    semaphore: asyncio.Semaphore = dataclasses.field(init=False)
+
+    def __post_init__(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+
+
+class LaneBroker:
+    """
+    Lane bookkeeping shared by the priority brokers: the lane of a task is
+    its `queue_name` label, a lane is not polled while its concurrency
+    budget is exhausted and a lower lane is polled first when its minimum
+    share is due.
+    """
+
+    queue_name: str
+
+    def setup_lanes(self, lanes: list[Lane]) -> None:
+        self.lanes = {lane.queue_name: lane for lane in lanes}
+        self.released = asyncio.Event()
+
+        self.add_middlewares(LaneMiddleware())  # type: ignore
+
+    def order(self) -> list[Lane]:
+        for lane in self.lanes.values():
+            lane.credit = min(1.0, lane.credit + lane.min_share)
+
+        due = [lane for lane in self.lanes.values() if lane.credit >= 1.0]
+
+        return due + [lane for lane in self.lanes.values() if lane not in due]
+
+    async def available_lanes(self) -> list[Lane]:
+        while True:
+            lanes = [lane for lane in self.order() if not lane.semaphore.locked()]
+            if lanes:
+                return lanes
+
+            self.released.clear()
+            await self.released.wait()
+
+    async def acquire(self, queue_name: str) -> None:
+        lane = self.lanes[queue_name]
+        lane.credit = max(0.0, lane.credit - 1.0)
+        await lane.semaphore.acquire()
+
+    def accepts(self, data: bytes) -> bool:
+        """
+        Whether the receiver will run a message: messages it cannot parse or
+        of unknown tasks are dropped before the middlewares, their lane would
+        never be released.
+        """
+        broker = cast(AsyncBroker, self)
+
+        try:
+            message = broker.formatter.loads(data)
+        except Exception:
+            return False
+
+        return broker.find_task(message.task_name) is not None
+
+    def release(self, queue_name: str | None) -> None:
+        lane = self.lanes.get(queue_name or self.queue_name)
+        if lane is None:
+            return
+
+        lane.semaphore.release()
+        self.released.set()
+
+
+class PriorityListQueueBroker(LaneBroker, ListQueueBroker):
+    """
+    Consumes several Redis lists, ordered by priority: BRPOP pops from the
+    first non-empty list, so higher lanes are always dequeued first, except
+    when a lower lane's minimum share is due.
+
+    Tasks are routed with the `queue_name` label.
+    """
+
+    def __init__(self, url: str, lanes: list[Lane], **kwargs: Any) -> None:
+        super().__init__(url, queue_name=lanes[0].queue_name, **kwargs)
+
+        self.setup_lanes(lanes)
+
+    async def listen(self) -> AsyncGenerator[bytes, None]:
+        while True:
+            lanes = await self.available_lanes()
+
+            try:
+                async with Redis(connection_pool=self.connection_pool) as redis_conn:
+                    popped = await redis_conn.brpop(
+                        [lane.queue_name for lane in lanes], timeout=1
+                    )  # type: ignore
+            except ConnectionError as exc:
+                logger.warning("Redis connection error: %s", exc)
+                continue
+
+            if popped is None:
+                continue
+
+            name, data = popped
+            queue_name = name.decode() if isinstance(name, bytes) else name
+
+            if self.accepts(data):
+                await self.acquire(queue_name)
+
+            yield data
+
+
+class PriorityRedisStreamBroker(LaneBroker, RedisStreamBroker):
+    """
+    Consumes one Redis stream per lane through a consumer group. Entries stay
+    pending until the worker acknowledges them, entries left pending by a
+    dead consumer for more than `reclaim_idle_timeout` seconds are reclaimed by
+    another one.
+
+    Lanes are polled in priority order, like `PriorityListQueueBroker`.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        lanes: list[Lane],
+        consumer_group_name: str = "correspondence",
+        reclaim_idle_timeout: float = 600.0,
+        reclaim_interval: float = 30.0,
+        reclaim_batch_size: int = 100,
+        read_block: float = 1.0,
+        maxlen: int | None = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            url,
+            queue_name=lanes[0].queue_name,
+            consumer_group_name=consumer_group_name,
+            # groups are created from the start of the streams, see startup
+            consumer_id="0",
+            **kwargs,
+        )
+
+        self.setup_lanes(lanes)
+
+        self.group_name = consumer_group_name
+        # not the names of the base class attributes, in milliseconds there
+        self.reclaim_idle_timeout = reclaim_idle_timeout
+        self.reclaim_interval = reclaim_interval
+        self.reclaim_batch_size = reclaim_batch_size
+        self.read_block = read_block
+        self.stream_maxlen = maxlen
+
+    async def startup(self) -> None:
+        await super().startup()
+
+        async with Redis(connection_pool=self.connection_pool) as redis_conn:
+            for lane in self.lanes.values():
+                try:
+                    # from the start of the stream, tasks may be kicked
+                    # before the first worker ever started
+                    await redis_conn.xgroup_create(
+                        lane.queue_name, self.group_name, id="0", mkstream=True
+                    )
+                except ResponseError as exc:
+                    if "BUSYGROUP" not in str(exc):
+                        raise
+
+    async def kick(self, message: BrokerMessage) -> None:
+        queue_name = message.labels.get("queue_name") or self.queue_name
+
+        async with Redis(connection_pool=self.connection_pool) as redis_conn:
+            await redis_conn.xadd(
+                queue_name,
+                {b"data": message.message},
+                maxlen=self.stream_maxlen,
+                approximate=True,
+            )
+
+    def ack_generator(self, queue_name: str, entry_id: bytes):
+        async def ack() -> None:
+            async with Redis(connection_pool=self.connection_pool) as redis_conn:
+                await redis_conn.xack(queue_name, self.group_name, entry_id)
+
+        return ack
+
+    async def read(
+        self, redis_conn: Redis, lanes: list[Lane], block: float | None = None
+    ) -> list[tuple[str, bytes, bytes]]:
+        response = await redis_conn.xreadgroup(
+            self.group_name,
+            self.consumer_name,
+            {lane.queue_name: ">" for lane in lanes},
+            count=1,
+            block=int(block * 1000) if block is not None else None,
+        )
+
+        entries: list[tuple[str, bytes, bytes]] = []
+        for queue_name, stream_entries in response or []:
+            if isinstance(queue_name, bytes):
+                queue_name = queue_name.decode()
+            for entry_id, fields in stream_entries:
+                entries.append((queue_name, entry_id, fields[b"data"]))
+
+        return entries
+
+    async def reclaim(
+        self, redis_conn: Redis, lanes: list[Lane]
+    ) -> list[tuple[str, bytes, bytes]]:
+        entries: list[tuple[str, bytes, bytes]] = []
+        for lane in lanes:
+            response = await redis_conn.xautoclaim(
+                lane.queue_name,
+                self.group_name,
+                self.consumer_name,
+                min_idle_time=int(self.reclaim_idle_timeout * 1000),
+                count=self.reclaim_batch_size,
+            )
+
+            # entries deleted from the stream since are returned without data
+            entries.extend(
+                (lane.queue_name, entry_id, fields[b"data"])
+                for entry_id, fields in response[1]
+                if fields and b"data" in fields
+            )
+
+        return entries
+
+    async def listen(self) -> AsyncGenerator[AckableMessage, None]:  # type: ignore
+        loop = asyncio.get_running_loop()
+        reclaimed_at = loop.time()
+
+        while True:
+            lanes = await self.available_lanes()
+
+            try:
+                async with Redis(connection_pool=self.connection_pool) as redis_conn:
+                    if loop.time() - reclaimed_at >= self.reclaim_interval:
+                        reclaimed_at = loop.time()
+                        entries = await self.reclaim(redis_conn, lanes)
+                    else:
+                        # lanes one by one so a higher lane is always served
+                        # first, then block until any of them gets an entry
+                        entries = []
+                        for lane in lanes:
+                            if entries := await self.read(redis_conn, [lane]):
+                                break
+                        else:
+                            entries = await self.read(
+                                redis_conn, lanes, block=self.read_block
+                            )
+            except ConnectionError as exc:
+                logger.warning("Redis connection error: %s", exc)
+                continue
+
+            for queue_name, entry_id, data in entries:
+                if self.accepts(data):
+                    await self.acquire(queue_name)
+
+                yield AckableMessage(
+                    data=data, ack=self.ack_generator(queue_name, entry_id)
+                )
+
+    async def stats(self) -> dict[str, dict[str, Any]]:
+        """
+        Length of each lane stream, with the number of entries delivered but
+        not acknowledged yet (pending) and not delivered yet (lag).
+        """
+        stats: dict[str, dict[str, Any]] = {}
+
+        async with Redis(connection_pool=self.connection_pool) as redis_conn:
+            for lane in self.lanes.values():
+                stats[lane.queue_name] = {
+                    "length": await redis_conn.xlen(lane.queue_name),
+                    "pending": None,
+                    "lag": None,
+                    "consumers": None,
+                }
+
+                try:
+                    groups = await redis_conn.xinfo_groups(lane.queue_name)
+                except ResponseError:
+                    continue
+
+                for group in groups:
+                    name = group["name"]
+                    if isinstance(name, bytes):
+                        name = name.decode()
+                    if name == self.group_name:
+                        stats[lane.queue_name].update(
+                            pending=group["pending"],
+                            lag=group.get("lag"),
+                            consumers=group["consumers"],
+                        )
+
+        return stats
+
+
+class LaneMiddleware(TaskiqMiddleware):
+    def post_execute(self, message: TaskiqMessage, result: TaskiqResult[Any]) -> None:
+        if isinstance(self.broker, LaneBroker):
+            self.broker.release(message.labels.get("queue_name"))
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from typing import Callable
+
+from redis.asyncio import Redis as AsyncRedis
+
+# Adaptive token bucket: tokens refill at `rate` per second (capped at `burst`),
+# `rate` is cut by `backoff` on throttling and recovers linearly by
+# `recovery` per second up to `max_rate`. Tokens may go negative, which
+# reserves a slot in the future: the caller sleeps for the returned delay.
+# A slot further than `max_wait` seconds (negative to disable) is not
+# reserved, the delay is returned with 0 instead of 1 as first value.
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local max_rate = tonumber(ARGV[1])
+local min_rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local recovery = tonumber(ARGV[4])
+local backoff = tonumber(ARGV[5])
+local throttled = ARGV[6] == "1"
+local ttl = tonumber(ARGV[7])
+local max_wait = tonumber(ARGV[8])
+
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local state = redis.call("HMGET", key, "tokens", "ts", "rate")
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+local rate = tonumber(state[3]) or max_rate
+
+local elapsed = math.max(0, now - ts)
+rate = math.min(max_rate, rate + elapsed * recovery)
+tokens = math.min(burst, tokens + elapsed * rate)
+
+local wait = 0
+local acquired = 1
+if throttled then
+    rate = math.max(min_rate, rate * backoff)
+    tokens = math.min(tokens, 0)
+else
+    if tokens < 1 then
+        wait = (1 - tokens) / rate
+    end
+    if max_wait >= 0 and wait > max_wait then
+        acquired = 0
+    else
+        tokens = tokens - 1
+    end
+end
+
+redis.call("HSET", key, "tokens", tostring(tokens), "ts", tostring(now), "rate", tostring(rate))
+redis.call("EXPIRE", key, ttl)
+
+return {acquired, tostring(wait)}
+"""
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limit exceeded, retry in {retry_after:.1f}s")
+
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    async def acquire(self, max_wait: float | None = None) -> None:
+        """
+        Wait for a slot, raises `RateLimited` without taking it when it is
+        more than `max_wait` seconds away.
+        """
+
+    async def throttled(self) -> None: ...
+
+
+class InMemoryRateLimiter(RateLimiter):
+    def __init__(
+        self,
+        rate: float,
+        burst: float | None = None,
+        min_rate: float | None = None,
+        recovery: float = 0.5,
+        backoff: float = 0.5,
+    ):
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 10
+        self.burst = burst or rate
+        self.recovery = recovery
+        self.backoff = backoff
+
+        self.rate = rate
+        self.tokens = self.burst
+        self.ts = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        elapsed = max(0.0, now - self.ts)
+        self.rate = min(self.max_rate, self.rate + elapsed * self.recovery)
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.ts = now
+
+    async def acquire(self, max_wait: float | None = None) -> None:
+        self.refill()
+
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            raise RateLimited(wait)
+
+        self.tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def throttled(self) -> None:
+        self.refill()
+        self.rate = max(self.min_rate, self.rate * self.backoff)
+        self.tokens = min(self.tokens, 0)
+
+
+class RedisRateLimiter(RateLimiter):
+    def __init__(
+        self,
+        async_redis: AsyncRedis,
+        key: str,
+        rate: float,
+        burst: float | None = None,
+        min_rate: float | None = None,
+        recovery: float = 0.5,
+        backoff: float = 0.5,
+        ttl: int = 3600,
+    ):
+        self.async_redis = async_redis
+        self.key = key
+        self.max_rate = rate
+        self.min_rate = min_rate or rate / 10
+        self.burst = burst or rate
+        self.recovery = recovery
+        self.backoff = backoff
+        self.ttl = ttl
+        self.script = async_redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def call(
+        self, throttled: bool, max_wait: float | None = None
+    ) -> tuple[bool, float]:
+        acquired, wait = await self.script(
+            keys=[self.key],
+            args=[
+                self.max_rate,
+                self.min_rate,
+                self.burst,
+                self.recovery,
+                self.backoff,
+                "1" if throttled else "0",
+                self.ttl,
+                -1 if max_wait is None else max_wait,
+            ],
+        )
+
+        return bool(acquired), float(wait)
+
+    async def acquire(self, max_wait: float | None = None) -> None:
+        acquired, wait = await self.call(throttled=False, max_wait=max_wait)
+        if not acquired:
+            raise RateLimited(wait)
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def throttled(self) -> None:
+        await self.call(throttled=True)
+
+
+class SenderRateLimiter:
+    """
+    One rate limiter per sending number, created on first use by `factory`
+    with the rate set for the number or the default `rate`. Waiters of a
+    number queue up behind its own limiter only, so other numbers are not
+    slowed down. Slots further than `max_wait` seconds are not waited for,
+    `RateLimited` is raised so the message is retried later instead of
+    holding its claim and worker slot.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str, float], RateLimiter] | None = None,
+        rate: float = 0,
+        max_wait: float | None = None,
+    ):
+        self.factory = factory
+        self.rate = rate
+        self.max_wait = max_wait
+
+        self.rates: dict[str, float] = {}
+        self.limiters: dict[str, RateLimiter] = {}
+
+    def set_rate(self, sender: str, rate: float | None) -> None:
+        rate = rate if rate is not None else self.rate
+        if self.rates.get(sender, self.rate) != rate:
+            self.limiters.pop(sender, None)
+
+        self.rates[sender] = rate
+
+    def get(self, sender: str) -> RateLimiter:
+        if sender not in self.limiters:
+            rate = self.rates.get(sender, self.rate)
+            if rate and self.factory is not None:
+                self.limiters[sender] = self.factory(sender, rate)
+            else:
+                self.limiters[sender] = RateLimiter()
+
+        return self.limiters[sender]
+
+    async def acquire(self, sender: str) -> None:
+        await self.get(sender).acquire(max_wait=self.max_wait)
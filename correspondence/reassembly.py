@@ -0,0 +1,103 @@
+import dataclasses
+import json
+
+from redis.asyncio import Redis as AsyncRedis
+
+# Store a fragment in the hash of its concatenated message, only once per
+# part number so provider retries are not counted twice, and count it: the
+# fragment bringing the count to the total gets every part back and is the
+# only one to assemble the message. The hash outlives the completion until
+# its TTL so late retries are still recognized as duplicates.
+ADD_PART_SCRIPT = """
+local key = KEYS[1]
+local part = ARGV[1]
+local value = ARGV[2]
+local total = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+
+local created = redis.call("HSETNX", key, "part:" .. part, value)
+redis.call("EXPIRE", key, ttl)
+if created == 0 then
+    return nil
+end
+
+if redis.call("HINCRBY", key, "count", 1) ~= total then
+    return nil
+end
+
+return redis.call("HGETALL", key)
+"""
+
+# Forget a fragment, when its message could not be written, so the retry of
+# this fragment by the provider completes the message again.
+REMOVE_PART_SCRIPT = """
+local key = KEYS[1]
+local part = ARGV[1]
+
+if redis.call("HDEL", key, "part:" .. part) == 1 then
+    redis.call("HINCRBY", key, "count", -1)
+end
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class MessageFragment:
+    part: int
+    body: str
+    provider_id: str
+
+
+class ReassemblyBuffer:
+    """
+    Buffer the fragments of concatenated inbound messages in Redis, one hash
+    per (organization, concat ref), so only assembled messages are written
+    to the database.
+    """
+
+    def __init__(self, async_redis: AsyncRedis, ttl: int = 86400):
+        self.async_redis = async_redis
+        self.ttl = ttl
+        self.add_script = async_redis.register_script(ADD_PART_SCRIPT)
+        self.remove_script = async_redis.register_script(REMOVE_PART_SCRIPT)
+
+    def get_key(self, organization_id: int, ref: str) -> str:
+        return f"reassembly:{organization_id}:{ref}"
+
+    async def add(
+        self,
+        organization_id: int,
+        ref: str,
+        total: int,
+        fragment: MessageFragment,
+    ) -> list[MessageFragment] | None:
+        """
+        Add a fragment, returns every fragment in order once the message is
+        complete, `None` otherwise.
+        """
+        result = await self.add_script(
+            keys=[self.get_key(organization_id, ref)],
+            args=[
+                fragment.part,
+                json.dumps(
+                    {"body": fragment.body, "provider_id": fragment.provider_id}
+                ),
+                total,
+                self.ttl,
+            ],
+        )
+        if not result:
+            return None
+
+        values = dict(zip(result[::2], result[1::2]))
+
+        return sorted(
+            [
+                MessageFragment(part=int(field.split(b":", 1)[1]), **json.loads(value))
+                for field, value in values.items()
+                if field.startswith(b"part:")
+            ],
+            key=lambda fragment: fragment.part,
+        )
+
+    async def remove(self, organization_id: int, ref: str, part: int) -> None:
+        await self.remove_script(keys=[self.get_key(organization_id, ref)], args=[part])
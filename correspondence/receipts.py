@@ -0,0 +1,111 @@
+import asyncio
+import dataclasses
+from typing import Any
+
+import structlog
+
+from correspondence.db.engine import AsyncSession, DatabaseEngine
+
+logger = structlog.get_logger("receipts")
+
+
+@dataclasses.dataclass
+class DeliveryReceipt:
+    provider_id: str
+    status: str
+    error_code: str | None = None
+    price: str | None = None
+    network: str | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return dataclasses.asdict(self)
+
+
+class DeliveryReceiptBuffer:
+    """
+    Collects delivery receipts in memory and writes them with a single
+    statement per batch, either once `batch_size` receipts are pending or
+    every `flush_interval` seconds.
+    """
+
+    def __init__(
+        self, db: DatabaseEngine, batch_size: int = 500, flush_interval: float = 1.0
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # keyed by provider id so only the latest status of a part is written
+        self.pending: dict[str, DeliveryReceipt] = {}
+        self.full = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    def add(self, receipt: DeliveryReceipt) -> None:
+        self.pending.pop(receipt.provider_id, None)
+        self.pending[receipt.provider_id] = receipt
+
+        if len(self.pending) >= self.batch_size:
+            self.full.set()
+
+    def drain(self) -> list[DeliveryReceipt]:
+        receipts = list(self.pending.values())[: self.batch_size]
+        for receipt in receipts:
+            del self.pending[receipt.provider_id]
+
+        if len(self.pending) < self.batch_size:
+            self.full.clear()
+
+        return receipts
+
+    async def write(
+        self, asession: AsyncSession, receipts: list[DeliveryReceipt]
+    ) -> None:
+        from correspondence.models import MessageStatus
+
+        await MessageStatus.abulk_upsert(
+            asession, [receipt.to_dict() for receipt in receipts]
+        )
+
+    async def flush(self, asession: AsyncSession) -> int:
+        count = 0
+        while receipts := self.drain():
+            await self.write(asession, receipts)
+            count += len(receipts)
+
+        return count
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            while receipts := self.drain():
+                try:
+                    async with self.db.async_session_local() as asession:
+                        await self.write(asession, receipts)
+                        await asession.commit()
+                except Exception:
+                    logger.exception("unable to flush delivery receipts")
+
+                    # newer receipts for the same parts take precedence
+                    for receipt in receipts:
+                        self.pending.setdefault(receipt.provider_id, receipt)
+                    break
+
+                logger.debug("delivery receipts flushed", count=len(receipts))
+
+    async def startup(self) -> None:
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def shutdown(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+        if self.pending:
+            async with self.db.async_session_local() as asession:
+                await self.flush(asession)
+                await asession.commit()
@@ -124,6 +124,7 @@ class MessageResource(Resource):
     created_at: datetime
     updated_at: datetime
     body: str
+    send_at: datetime | None = None
     conversation: ConversationResource | None = None
     sender: UserResource
 
@@ -136,6 +137,7 @@ class MessageResource(Resource):
             created_at=message.created_at,
             updated_at=message.updated_at,
             body=message.body,
+            send_at=message.send_at,
             sender=UserResource.from_model(
                 message.sender, extra_fields=trim_prefix("sender.", extra_fields)
             ),
@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+import structlog
+from redis.asyncio import Redis as AsyncRedis
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from correspondence.db.engine import AsyncSession, DatabaseEngine
+from correspondence.db.sql import select
+
+logger = structlog.get_logger("routing")
+
+
+class RoutingIndex:
+    """
+    In-process map of sending numbers to their organization for inbound
+    messages, loaded once and again when stale.
+
+    Commits changing phone numbers invalidate it, and other processes
+    through Redis pub/sub when available. Numbers changed outside of this
+    application are picked up after `ttl` seconds, and unknown numbers
+    reload it at most every `miss_interval` seconds so numbers added by
+    other processes are found without pub/sub.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseEngine,
+        async_redis: AsyncRedis | None = None,
+        channel: str = "routing:invalidate",
+        ttl: float = 300.0,
+        miss_interval: float = 5.0,
+    ):
+        self.db = db
+        self.async_redis = async_redis
+        self.channel = channel
+        self.ttl = ttl
+        self.miss_interval = miss_interval
+        self.numbers: dict[str, int] = {}
+        self.loaded_at: float | None = None
+        # incremented on invalidation, a load racing one is not fresh
+        self.generation = 0
+        self.task: asyncio.Task | None = None
+        self.publishing: set[asyncio.Task] = set()
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self.loaded_at = None
+
+    @property
+    def stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl
+
+    async def load(self, asession: AsyncSession) -> None:
+        from correspondence.models import PhoneNumber
+
+        generation = self.generation
+        loaded_at = time.monotonic()
+        result = await asession.execute(
+            select(PhoneNumber.number, PhoneNumber.organization_id)
+        )
+
+        self.numbers = {number: organization_id for number, organization_id in result}
+        # invalidated during the query, the map may predate the change
+        if self.generation == generation:
+            self.loaded_at = loaded_at
+
+    async def get(self, asession: AsyncSession, number: str) -> int | None:
+        if self.stale or (
+            number not in self.numbers
+            and self.loaded_at is not None
+            and time.monotonic() - self.loaded_at > self.miss_interval
+        ):
+            await self.load(asession)
+
+        return self.numbers.get(number)
+
+    async def publish(self) -> None:
+        if self.async_redis is None:
+            return
+
+        try:
+            await self.async_redis.publish(self.channel, "1")
+        except Exception:
+            logger.exception("unable to publish routing invalidation")
+
+    def changed(self) -> None:
+        self.invalidate()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        # keep a reference until done, the loop only holds weak ones
+        task = loop.create_task(self.publish())
+        self.publishing.add(task)
+        task.add_done_callback(self.publishing.discard)
+
+    def track(self) -> None:
+        """
+        Invalidate on commits of sessions which flushed phone number changes.
+        """
+        from correspondence.models import PhoneNumber
+
+        @event.listens_for(Session, "after_flush")
+        def after_flush(session: Session, flush_context) -> None:
+            if any(
+                isinstance(instance, PhoneNumber)
+                for instance in (*session.new, *session.dirty, *session.deleted)
+            ):
+                session.info["routing_changed"] = True
+
+        @event.listens_for(Session, "after_commit")
+        def after_commit(session: Session) -> None:
+            if session.info.pop("routing_changed", False):
+                self.changed()
+
+        @event.listens_for(Session, "after_rollback")
+        def after_rollback(session: Session) -> None:
+            session.info.pop("routing_changed", None)
+
+    async def listen(self) -> None:
+        assert self.async_redis is not None
+
+        while True:
+            try:
+                async with self.async_redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.invalidate()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("routing invalidation listener failed")
+                # invalidations may be missed until subscribed again
+                self.invalidate()
+                await asyncio.sleep(1)
+
+    async def startup(self) -> None:
+        async with self.db.async_session_local() as asession:
+            await self.load(asession)
+
+        if self.async_redis is not None and self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.listen())
+
+    async def shutdown(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
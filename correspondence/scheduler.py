@@ -0,0 +1,64 @@
+import asyncio
+
+import structlog
+
+from correspondence.db.engine import AsyncSession, DatabaseEngine
+
+logger = structlog.get_logger("scheduler")
+
+
+class MessageScheduler:
+    """
+    Moves scheduled messages to the outbox once they are due: due rows are
+    claimed in batches with FOR UPDATE SKIP LOCKED on the partial send_at
+    index, marked as queued and added to the outbox in the same transaction.
+    """
+
+    def __init__(
+        self, db: DatabaseEngine, batch_size: int = 500, poll_interval: float = 1.0
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.task: asyncio.Task | None = None
+
+    async def schedule(self, asession: AsyncSession) -> int:
+        from correspondence.models import Message, OutboxMessage
+
+        messages = await Message.aclaim_scheduled(asession, self.batch_size)
+        if not messages:
+            return 0
+
+        await Message.repository(asession).abulk_update(
+            clauses=[Message.id.in_([message.id for message in messages])],
+            status=Message.STATUS_QUEUED,
+        )
+        await OutboxMessage.aadd_many(asession, messages)
+
+        return len(messages)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                async with self.db.async_session_local() as asession:
+                    count = await self.schedule(asession)
+                    await asession.commit()
+            except Exception:
+                logger.exception("unable to schedule messages")
+                count = 0
+
+            if count:
+                logger.debug("scheduled messages queued", count=count)
+
+            # a full batch means more messages are probably due
+            if count < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def startup(self) -> None:
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def shutdown(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
@@ -1,14 +1,24 @@
+from datetime import timedelta
 from enum import Enum
 from typing import Any
 
-import phonenumbers
 from fastapi.exceptions import RequestValidationError
 from sqlalchemy.ext.asyncio.session import AsyncSession
 
+from correspondence import phones
 from correspondence.api import payloads
-from correspondence.conf import settings
 from correspondence.models import Conversation, Message, Organization, User
 from correspondence.provider import Provider
+from correspondence.utils import utc_now
+
+
+def get_phone_number_error(phone_number: str) -> dict[str, Any]:
+    return {
+        "type": "value_error",
+        "loc": ("body", "phone_number"),
+        "msg": "Invalid phone number.",
+        "input": phone_number,
+    }
 
 
 class UserService:
@@ -22,6 +32,14 @@ class UserService:
         repo = User.repository(asession)
 
         errors: list[Any] = []
+        if phone_number := data.get("phone_number"):
+            # normalized first so the uniqueness check compares stored values
+            data["phone_number"] = phones.normalize(
+                phone_number, user.country.code if user.country else None
+            ).e164
+            if data["phone_number"] is None:
+                errors.append(get_phone_number_error(phone_number))
+
         for field_name in ("phone_number", "active_campaign_id", "email"):
             if value := data.get(field_name):
                 exists = await repo.aexists(
@@ -47,18 +65,6 @@ class UserService:
         if "email" in data:
             user.email = data["email"]
 
-        if phone_number := data.get("phone_number"):
-            country_code = settings.DEFAULT_COUNTRY
-            if user.country:
-                country_code = user.country.code
-
-            phone_number_instance = phonenumbers.parse(
-                phone_number,
-                country_code,
-            )
-
-            user.phone_number = f"+{phone_number_instance.country_code}{phone_number_instance.national_number}"
-
         if country := data.get("country"):
             user.country = country
 
@@ -93,14 +99,11 @@ class UserService:
         organization: Organization,
         payload: payloads.UserCreatePayload,
     ) -> User:
-        phone_number_instance = phonenumbers.parse(
-            payload.phone_number,
-            payload.country,
-        )
-
-        phone_number = f"+{phone_number_instance.country_code}{phone_number_instance.national_number}"
+        phone_number = phones.normalize(payload.phone_number, payload.country).e164
         errors: list[Any] = []
-        if await User.repository(asession).aexists(
+        if phone_number is None:
+            errors.append(get_phone_number_error(payload.phone_number))
+        elif await User.repository(asession).aexists(
             clauses=[User.phone_number == phone_number]
         ):
             errors.append(
@@ -164,10 +167,15 @@ class UserService:
         receiver: User,
         payload: payloads.MessageCreatePayload,
     ) -> Message:
+        send_at = payload.send_at
+        if send_at is None and payload.delay:
+            send_at = utc_now() + timedelta(seconds=payload.delay)
+
         return await receiver.create_message(
             asession,
             payload.body,
             sender=sender,
+            send_at=send_at,
         )
 
 
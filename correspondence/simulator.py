@@ -0,0 +1,137 @@
+"""
+Fake Nexmo SMS API and a provider talking to it in-process, to benchmark
+the send path without network access.
+
+Use the provider with:
+
+    SMS_PROVIDER_CLASS="correspondence.simulator.SimulatedProvider"
+    SMS_PROVIDER_OPTIONS='{"latency": "lognormal", "latency_mean": 0.2, "failure_ratio": 0.01}'
+
+or run the fake server standalone (see `make run-fake-nexmo`) and point
+`NexmoProvider` to it with SMS_PROVIDER_BASE_URL.
+"""
+
+import asyncio
+import dataclasses
+import math
+import random
+import uuid
+from typing import Any
+
+import httpx
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+
+from correspondence.encoding import count_gsm7_segments, count_ucs2_segments
+from correspondence.provider import NexmoProvider
+
+
+@dataclasses.dataclass
+class Simulation:
+    # fixed, uniform, exponential or lognormal
+    latency: str = "fixed"
+    latency_mean: float = 0.0
+    latency_sigma: float = 0.5
+    throttle_ratio: float = 0.0
+    failure_ratio: float = 0.0
+
+    def sample_latency(self) -> float:
+        mean = self.latency_mean
+        if mean <= 0:
+            return 0.0
+
+        match self.latency:
+            case "uniform":
+                return random.uniform(0, 2 * mean)
+            case "exponential":
+                return random.expovariate(1 / mean)
+            case "lognormal":
+                # keep the distribution mean equal to latency_mean
+                mu = math.log(mean) - self.latency_sigma**2 / 2
+                return random.lognormvariate(mu, self.latency_sigma)
+
+        return mean
+
+
+def create_app(simulation: Simulation | None = None, **options: Any) -> FastAPI:
+    simulation = simulation or Simulation(**options)
+
+    app = FastAPI()
+
+    @app.post("/sms/json")
+    async def sms(request: Request) -> JSONResponse:
+        payload = await request.json()
+
+        await asyncio.sleep(simulation.sample_latency())
+
+        if random.random() < simulation.failure_ratio:
+            return JSONResponse(
+                {"error": "simulated failure"},
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        text = payload.get("text", "")
+        if payload.get("type") == "unicode":
+            _, segments = count_ucs2_segments(text)
+        else:
+            _, segments = count_gsm7_segments(text)
+
+        if random.random() < simulation.throttle_ratio:
+            messages = [
+                {
+                    "status": NexmoProvider.STATUS_THROTTLED,
+                    "error-text": "Throughput Rate Exceeded",
+                }
+            ]
+        else:
+            messages = [
+                {
+                    "to": payload.get("to"),
+                    "message-id": uuid.uuid4().hex.upper(),
+                    "status": "0",
+                    "remaining-balance": "100.00",
+                    "message-price": "0.05",
+                    "network": "20801",
+                }
+                for _ in range(segments)
+            ]
+
+        return JSONResponse({"message-count": str(len(messages)), "messages": messages})
+
+    return app
+
+
+class SimulatedProvider(NexmoProvider):
+    base_url = "http://simulator"
+
+    def __init__(
+        self,
+        account: str = "",
+        token: str = "",
+        latency: str = "fixed",
+        latency_mean: float = 0.0,
+        latency_sigma: float = 0.5,
+        throttle_ratio: float = 0.0,
+        failure_ratio: float = 0.0,
+        **kw: Any,
+    ):
+        self.app = create_app(
+            Simulation(
+                latency=latency,
+                latency_mean=latency_mean,
+                latency_sigma=latency_sigma,
+                throttle_ratio=throttle_ratio,
+                failure_ratio=failure_ratio,
+            )
+        )
+
+        kw.pop("base_url", None)
+
+        super().__init__(account, token, **kw)
+
+    def create_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            transport=httpx.ASGITransport(app=self.app),
+        )
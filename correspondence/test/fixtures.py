@@ -6,6 +6,7 @@ from fastapi.testclient import TestClient
 from httpx import ASGITransport
 from sqlalchemy import event
 
+from correspondence.cache import InMemoryCache
 from correspondence.db.deps import get_db_asession, get_db_session
 from correspondence.db.engine import AsyncSession, Session
 from correspondence.main import app
@@ -17,6 +18,19 @@ from .client import AsyncClient
 DEFAULT_PASSWORD = "$ecret"
 
 
+@pytest.fixture(autouse=True)
+def cache(monkeypatch: pytest.MonkeyPatch) -> InMemoryCache:
+    # keys like dedupe windows must not leak between tests
+    cache = InMemoryCache()
+    monkeypatch.setattr(app, "cache", cache)
+    # fragments of inbound messages go through message parts
+    monkeypatch.setattr(app, "reassembly", None)
+    # numbers of rolled back tests must not be routed
+    app.routing.invalidate()
+
+    return cache
+
+
 @pytest_asyncio.fixture()
 async def staff_member(asession: AsyncSession):
     user = User(
@@ -1,8 +1,6 @@
 from datetime import datetime, timezone
 from functools import lru_cache
 
-import phonenumbers
-from phonenumbers.phonenumberutil import NumberParseException
 from sqlalchemy_utils import i18n
 
 utc = timezone.utc
@@ -27,20 +25,6 @@ def get_countries() -> list[tuple[str, str]]:
     )
 
 
-def parse_phonenumber(
-    phone_number: str, default_country: str
-) -> phonenumbers.PhoneNumber | None:
-    for country in (None, default_country):
-        try:
-            phone_number_instance = phonenumbers.parse(phone_number, country)
-        except NumberParseException:
-            pass
-        else:
-            return phone_number_instance
-
-    return None
-
-
 def import_string(path: str):
     """
     Path must be module.path.ClassName
@@ -1,68 +1,231 @@
+import itertools
+import json
 import time
-from typing import Annotated
+from datetime import timedelta
+from typing import Annotated, Any
 
-import phonenumbers
 import structlog
 from fastapi import (APIRouter, Depends, Form, HTTPException, Request,
                      Response, status)
+from pydantic import BaseModel, TypeAdapter, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from correspondence.conf import settings
+from correspondence import phones
+from correspondence.cache import Cache
+from correspondence.conf import Queue, settings
 from correspondence.db import deps
 from correspondence.deps import get_automessage_by_id
 from correspondence.models import AutoMessage
-from correspondence.utils import parse_phonenumber
 
 router = APIRouter(prefix="/automessage")
 
 
+class AutoMessageContactPayload(BaseModel):
+    phone: str
+    id: str | None = None
+    first_name: str | None = None
+    last_name: str | None = None
+    email: str | None = None
+
+
+def normalize_phone_number(phone_number: str) -> tuple[str, str] | None:
+    normalized = phones.normalize(phone_number)
+    if not normalized.valid:
+        return None
+
+    assert normalized.e164 is not None and normalized.region is not None
+
+    return normalized.e164, normalized.region
+
+
+def parse_contacts(body: bytes, content_type: str) -> list[AutoMessageContactPayload]:
+    try:
+        if content_type.startswith("application/x-ndjson"):
+            data = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            data = json.loads(body)
+
+        return TypeAdapter(list[AutoMessageContactPayload]).validate_python(data)
+    except (ValueError, ValidationError) as exc:
+        raise HTTPException(status_code=400, detail=f"invalid contacts: {exc}")
+
+
+def get_dedupe_key(automessage_id: int, phone_number: str) -> str:
+    return f"automessage:dedupe:{automessage_id}:{phone_number}"
+
+
+def get_exists_key(automessage_id: int) -> str:
+    return f"automessage:exists:{automessage_id}"
+
+
+async def check_automessage(
+    cache: Cache, asession: AsyncSession, automessage_id: int
+) -> None:
+    """
+    Answer unknown automessages with a 404 before enqueuing their contacts,
+    the worker would drop them. Known ones are cached so deliveries do not
+    wait for the database.
+    """
+    key = get_exists_key(automessage_id)
+    if await cache.aget(key):
+        return
+
+    await AutoMessage.repository(asession).aget_or_404(automessage_id)
+    await cache.aset(key, "1", ex=timedelta(seconds=settings.AUTOMESSAGE_EXISTS_TTL))
+
+
+async def enqueue_contacts(automessage_id: int, contacts: list[dict[str, Any]]) -> None:
+    from correspondence.broker import automessage_contacts_sent
+
+    # sent by a worker, the request does not wait for the database
+    await (
+        automessage_contacts_sent.kicker()
+        .with_labels(queue_name=Queue.campaign.value)
+        .kiq(automessage_id, contacts)
+    )
+
+
+@router.post("/{automessage_id}/bulk")
+async def automessage_bulk(
+    request: Request,
+    automessage_id: int,
+    response: Response,
+    asession: AsyncSession = Depends(deps.get_db_asession),
+):
+    """
+    Send an automessage to a JSON list, or newline delimited JSON, of
+    contacts with the keys of the single contact webhook.
+    """
+    contacts = parse_contacts(
+        await request.body(), request.headers.get("content-type", "")
+    )
+
+    start_time = time.time()
+
+    invalid: list[str] = []
+    values: list[dict[str, Any]] = []
+    for contact, normalized in zip(
+        contacts, phones.normalize_many(contact.phone for contact in contacts)
+    ):
+        if not normalized.valid:
+            invalid.append(contact.phone)
+            continue
+
+        values.append(
+            {
+                "phone_number": normalized.e164,
+                "first_name": contact.first_name,
+                "last_name": contact.last_name,
+                "email": contact.email,
+                "country": normalized.region,
+                "active_campaign_id": contact.id,
+            }
+        )
+
+    if settings.AUTOMESSAGE_ASYNC:
+        await check_automessage(request.app.cache, asession, automessage_id)
+
+        for batch in itertools.batched(values, settings.AUTOMESSAGE_BULK_BATCH_SIZE):
+            await enqueue_contacts(automessage_id, list(batch))
+
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"accepted": len(values), "invalid": invalid}
+
+    automessage = await get_automessage_by_id(automessage_id, asession)
+
+    created = 0
+    conflicts: list[str] = []
+    for batch in itertools.batched(values, settings.AUTOMESSAGE_BULK_BATCH_SIZE):
+        result = await automessage.asend_many(asession, batch)
+        await asession.commit()
+
+        created += len(result.messages)
+        conflicts.extend(contact["phone_number"] for contact in result.conflicts)
+
+    structlog.get_logger().debug(
+        "bulk messages created",
+        automessage_id=automessage.id,
+        count=created,
+        duration=time.time() - start_time,
+    )
+
+    return {
+        "created": created,
+        "skipped": len(values) - created - len(conflicts),
+        "invalid": invalid,
+        # their email or id belongs to another user
+        "conflicts": conflicts,
+    }
+
+
 @router.post("/{automessage_id}")
 async def automessage(
     request: Request,
+    automessage_id: int,
     phone_number: Annotated[str, Form(alias="contact[phone]")],
     active_campaign_id: Annotated[str, Form(alias="contact[id]")],
     response: Response,
     first_name: Annotated[str | None, Form(alias="contact[first_name]")] = None,
     last_name: Annotated[str | None, Form(alias="contact[last_name]")] = None,
     email: Annotated[str | None, Form(alias="contact[email]")] = None,
-    automessage: AutoMessage = Depends(get_automessage_by_id),
     asession: AsyncSession = Depends(deps.get_db_asession),
 ):
     if not phone_number:
         raise HTTPException(status_code=400, detail="no phone_number provided")
 
-    phone_number_instance = parse_phonenumber(phone_number, settings.DEFAULT_COUNTRY)
-
-    if phone_number_instance is None or not phonenumbers.is_valid_number(
-        phone_number_instance
-    ):
+    if not (normalized := normalize_phone_number(phone_number)):
         raise HTTPException(
             status_code=400, detail=f"invalid phone_number: {phone_number}"
         )
 
-    phone_number = (
-        f"+{phone_number_instance.country_code}{phone_number_instance.national_number}"
-    )
-
-    start_time = time.time()
-    country_code = phonenumbers.region_code_for_number(phone_number_instance)
-
-    message = await automessage.send_message(
-        asession,
-        request.app.provider,
-        phone_number=phone_number,
-        defaults={
-            "first_name": first_name,
-            "last_name": last_name,
-            "email": email,
-            "country": country_code,
-            "active_campaign_id": active_campaign_id,
-        },
-    )
-    duration = time.time() - start_time
+    phone_number, country_code = normalized
+    defaults = {
+        "first_name": first_name,
+        "last_name": last_name,
+        "email": email,
+        "country": country_code,
+        "active_campaign_id": active_campaign_id,
+    }
 
     logger = structlog.get_logger()
 
+    # retried or double fired deliveries are answered without the database
+    dedupe_key = get_dedupe_key(automessage_id, phone_number)
+    if settings.AUTOMESSAGE_DEDUPE_TTL and not await request.app.cache.aadd(
+        dedupe_key, "1", ex=timedelta(seconds=settings.AUTOMESSAGE_DEDUPE_TTL)
+    ):
+        logger.debug(
+            "no message created, duplicate delivery",
+            automessage_id=automessage_id,
+        )
+        return ""
+
+    try:
+        if settings.AUTOMESSAGE_ASYNC:
+            await check_automessage(request.app.cache, asession, automessage_id)
+            await enqueue_contacts(
+                automessage_id, [{**defaults, "phone_number": phone_number}]
+            )
+
+            response.status_code = status.HTTP_202_ACCEPTED
+            return ""
+
+        automessage = await get_automessage_by_id(automessage_id, asession)
+
+        start_time = time.time()
+
+        message = await automessage.send_message(
+            asession,
+            phone_number=phone_number,
+            defaults=defaults,
+        )
+    except Exception:
+        # the next delivery must be processed
+        await request.app.cache.adelete(dedupe_key)
+        raise
+
+    duration = time.time() - start_time
+
     if message:
         logger.debug("message created", duration=duration, message_id=message.id)
 
@@ -70,7 +233,8 @@ async def automessage(
         return ""
 
     logger.debug(
-        "no message created, automessage already sent in conversation",
+        "no message created, automessage already sent in conversation or "
+        "contact conflicting with another user",
         automessage_id=automessage.id,
         duration=duration,
     )
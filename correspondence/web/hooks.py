@@ -3,10 +3,12 @@ from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, Field
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.sql import ColumnElement
 
+from correspondence.conf import Queue
 from correspondence.db.deps import get_db_asession
-from correspondence.models import MessagePart, Organization
+from correspondence.inbound import InboundMessage, aforget, areceive
+from correspondence.models import User
+from correspondence.receipts import DeliveryReceipt
 from correspondence.resources import MessageResource
 
 router = APIRouter(prefix="/hooks")
@@ -23,6 +25,16 @@ class NexmoPayload(BaseModel):
     text: Annotated[str, Field(alias="text")]
 
 
+class NexmoDeliveryReceiptPayload(BaseModel):
+    msisdn: str | None = None
+    to: str | None = None
+    message_id: Annotated[str, Field(alias="messageId")]
+    status: str
+    err_code: Annotated[str | None, Field(alias="err-code")] = None
+    price: str | None = None
+    network_code: Annotated[str | None, Field(alias="network-code")] = None
+
+
 @router.post("/nexmo")
 async def nexmo(
     request: Request,
@@ -36,77 +48,79 @@ async def nexmo(
 
         phone_numbers[k] = f"+{v}"
 
-    organization = await Organization.get_from_phone_number(
-        asession, phone_numbers["to"]
+    if payload.concat and not all(
+        [payload.concat_part is not None, payload.concat_ref is not None]
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            detail="payload is malformed",
+        )
+
+    inbound = InboundMessage(
+        sender=phone_numbers["from"],
+        receiver=phone_numbers["to"],
+        provider_id=payload.message_id,
+        text=payload.text,
+        concat_ref=payload.concat_ref if payload.concat else None,
+        concat_part=payload.concat_part,
+        concat_total=payload.concat_total,
     )
-    if not organization:
+
+    if request.app.settings.INBOUND_ASYNC:
+        await enqueue_inbound(inbound)
+
+        return {"message": "ok"}
+
+    organization_id = await request.app.routing.get(asession, inbound.receiver)
+    if organization_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"organization with phone_number {phone_numbers['to']} does not exist",
         )
 
-    user = await organization.get_user_from_phone_number(
-        asession, phone_numbers["from"]
-    )
+    user = await User.get_from_phone_number(asession, organization_id, inbound.sender)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"user with phone number {phone_numbers['from']} does not exist",
         )
 
-    if not payload.concat:
-        message = await user.create_message(
-            asession,
-            payload.text,
-            send=False,
-            extra_data={"provider_ids": [payload.message_id]},
-        )
-
-        return MessageResource.from_model(message)
-
-    if not all([payload.concat_part is not None, payload.concat_ref is not None]):
-        raise HTTPException(
-            status_code=status.HTTP_406_NOT_ACCEPTABLE,
-            detail="payload is malformed",
-        )
-
-    repo = MessagePart.repository(asession)
-    messagepart, created = await repo.aget_or_create(
-        part_id=payload.concat_part,
-        part_ref=payload.concat_ref,
-        organization_id=organization.id,
-        defaults={
-            "body": payload.text,
-            "sender_id": user.id,
-            "provider_id": payload.message_id,
-        },
+    message = await areceive(
+        asession, user, organization_id, inbound, request.app.reassembly
     )
+    if message is None:
+        return {"message": "ok"}
 
-    clauses: list[ColumnElement[bool]] = [
-        MessagePart.organization_id == organization.id,
-        MessagePart.part_ref == payload.concat_ref,
-        MessagePart.message_id.is_(None),
-    ]
-    parts = await repo.aall(clauses=clauses)
+    try:
+        await asession.commit()
+    except Exception:
+        await aforget(request.app.reassembly, organization_id, inbound)
+        raise
 
-    if len(parts) == payload.concat_total:
-        parts = sorted(parts, key=lambda part: part.part_id)
+    return MessageResource.from_model(message)
 
-        provider_ids = [part.provider_id for part in parts]
 
-        body = "".join([part.body for part in parts])
+async def enqueue_inbound(inbound: InboundMessage) -> None:
+    from correspondence.broker import inbound_received
 
-        async with asession.begin_nested():
-            message = await user.create_message(
-                asession,
-                body,
-                send=False,
-                extra_data={"provider_ids": provider_ids},
-            )
+    # written by a worker, providers redeliver when the answer is slow
+    await (
+        inbound_received.kicker()
+        .with_labels(queue_name=Queue.interactive.value)
+        .kiq(inbound.to_dict())
+    )
 
-            await asession.flush()
-            await repo.abulk_update(clauses=clauses, message_id=message.id)
 
-            return MessageResource.from_model(message)
+@router.post("/nexmo/dlr")
+async def nexmo_dlr(request: Request, payload: NexmoDeliveryReceiptPayload):
+    request.app.receipts.add(
+        DeliveryReceipt(
+            provider_id=payload.message_id,
+            status=payload.status,
+            error_code=payload.err_code,
+            price=payload.price,
+            network=payload.network_code,
+        )
+    )
 
     return {"message": "ok"}
@@ -1,9 +1,12 @@
+from datetime import timedelta, timezone
+
 import pytest
 from fastapi import status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from correspondence.models import Conversation, Message, Organization, User
 from correspondence.test.client import AsyncClient
+from correspondence.utils import utc_now
 
 
 @pytest.mark.asyncio
@@ -210,6 +213,17 @@ async def test_user_create(
     response = await aclient.post(url, json={}, user=staff_member)
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
 
+    response = await aclient.post(
+        url,
+        json={
+            "phone_number": "not a number",
+            "country": "FR",
+            "manager_id": staff_member.id,
+        },
+        user=staff_member,
+    )
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
     payload = {
         "phone_number": "+33679368526",
         "country": "FR",
@@ -301,6 +315,28 @@ async def test_user_conversation_create(
     assert conversation.unread is True
 
 
+@pytest.mark.asyncio
+async def test_user_conversation_create_naive_send_at(
+    aclient: AsyncClient,
+    staff_member: User,
+    default_user: User,
+    asession: AsyncSession,
+):
+    send_at = (utc_now() + timedelta(hours=1)).replace(tzinfo=None, microsecond=0)
+
+    response = await aclient.post(
+        f"/api/users/{default_user.id}/conversation/",
+        json={"body": "Later", "send_at": send_at.isoformat()},
+        user=staff_member,
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    message = await Message.repository(asession).aget(response.json()["id"])
+    assert message is not None
+    assert message.status == Message.STATUS_SCHEDULED
+    assert message.send_at == send_at.replace(tzinfo=timezone.utc)
+
+
 @pytest.mark.asyncio
 async def test_organization_conversation_list(
     aclient: AsyncClient, default_organization: Organization, staff_member: User
@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from correspondence.batcher import Batcher
+
+
+@pytest.mark.asyncio
+async def test_batcher():
+    batches: list[list[int]] = []
+
+    async def handler(keys: list[int]) -> dict[int, int]:
+        batches.append(keys)
+        return {key: key * 2 for key in keys}
+
+    batcher: Batcher[int, int] = Batcher(handler, size=3, linger=0.01)
+
+    results = await asyncio.gather(*[batcher.submit(key) for key in range(5)])
+
+    assert results == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2], [3, 4]]
+
+
+@pytest.mark.asyncio
+async def test_batcher_error():
+    async def handler(keys: list[int]) -> dict[int, int]:
+        raise Exception("database is down")
+
+    batcher: Batcher[int, int] = Batcher(handler, size=2, linger=0.01)
+
+    with pytest.raises(Exception, match="database is down"):
+        await batcher.submit(1)
@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from correspondence.broadcast import process_batch
+from correspondence.models import (AutoMessage, Broadcast, Organization,
+                                   OutboxMessage, User)
+from correspondence.utils import utc_now
+
+
+@pytest.mark.asyncio
+async def test_broadcast_process_batch(
+    asession: AsyncSession,
+    default_automessage: AutoMessage,
+    default_organization: Organization,
+):
+    users = [
+        await User.repository(asession).acreate(
+            phone_number=f"+3367936852{i}",
+            country="FR" if i < 3 else "BE",
+            organization_id=default_organization.id,
+        )
+        for i in range(4)
+    ]
+
+    broadcast = await Broadcast.repository(asession).acreate(
+        automessage_id=default_automessage.id,
+        organization_id=default_organization.id,
+        filters={"country": "FR"},
+    )
+    assert await broadcast.acount_users(asession) == 3
+
+    assert await process_batch(asession, broadcast, default_automessage, 2) == 2
+    assert broadcast.last_user_id == users[1].id
+    assert broadcast.created_count == 2
+
+    assert await process_batch(asession, broadcast, default_automessage, 2) == 1
+    assert await process_batch(asession, broadcast, default_automessage, 2) == 0
+
+    assert broadcast.processed_count == 3
+    assert broadcast.created_count == 3
+    assert await OutboxMessage.repository(asession).acount() == 3
+
+    # resuming from the start skips users who already received it
+    broadcast.last_user_id = 0
+    assert await process_batch(asession, broadcast, default_automessage, 10) == 3
+    assert broadcast.created_count == 3
+
+
+@pytest.mark.asyncio
+async def test_broadcast_claim(
+    asession: AsyncSession,
+    default_automessage: AutoMessage,
+    default_organization: Organization,
+):
+    broadcast = await Broadcast.repository(asession).acreate(
+        automessage_id=default_automessage.id,
+        organization_id=default_organization.id,
+    )
+    stale_after = timedelta(minutes=10)
+
+    assert await Broadcast.aclaim(asession, broadcast.id, stale_after) is not None
+    assert broadcast.status == Broadcast.STATUS_RUNNING
+
+    # already running
+    assert await Broadcast.aclaim(asession, broadcast.id, stale_after) is None
+
+    # a run which stopped updating it is dead
+    await Broadcast.repository(asession).abulk_update(
+        filter_by={"id": broadcast.id}, updated_at=utc_now() - stale_after * 2
+    )
+    assert await Broadcast.aclaim(asession, broadcast.id, stale_after) is not None
+
+    await Broadcast.repository(asession).abulk_update(
+        filter_by={"id": broadcast.id}, status=Broadcast.STATUS_DONE
+    )
+    assert await Broadcast.aclaim(asession, broadcast.id, stale_after) is None
@@ -0,0 +1,104 @@
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from taskiq import Context, TaskiqMessage
+
+from correspondence.broker import get_claim_key, messages_sent, send_messages
+from correspondence.cache import InMemoryCache
+from correspondence.conf import Queue
+from correspondence.main import app
+from correspondence.models import (DeadLetter, Organization, OutboxMessage,
+                                   PhoneNumber, User)
+from correspondence.provider import Provider
+from correspondence.simulator import SimulatedProvider
+
+
+class AcceptingProvider(Provider):
+    async def create_message(self, from_: str, to: str, body: str) -> list[str] | None:
+        return [f"{to}:{body}"]
+
+
+@pytest.mark.asyncio
+async def test_send_messages_commit_failure(
+    asession: AsyncSession,
+    cache: InMemoryCache,
+    default_organization: Organization,
+    default_phone_number: PhoneNumber,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    user = await User.repository(asession).acreate(
+        phone_number="+33679368526",
+        country="FR",
+        organization_id=default_organization.id,
+    )
+    # no sending number in this country, never accepted by the provider
+    unsendable = await User.repository(asession).acreate(
+        phone_number="+32470123456",
+        country="BE",
+        organization_id=default_organization.id,
+    )
+    sent = await user.create_message(asession, body="Hello")
+    not_sent = await unsendable.create_message(asession, body="Hello")
+
+    @asynccontextmanager
+    async def async_session_local():
+        yield asession
+
+    async def commit() -> None:
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(app, "provider", AcceptingProvider())
+    monkeypatch.setattr(app.db, "async_session_local", async_session_local)
+    monkeypatch.setattr(asession, "commit", commit)
+
+    with pytest.raises(RuntimeError):
+        await send_messages([sent.id, not_sent.id])
+
+    # the accepted message stays claimed so a redelivery does not resend it
+    assert await cache.aadd(get_claim_key(sent.id), "1") is False
+    assert await cache.aadd(get_claim_key(not_sent.id), "1") is True
+
+
+@pytest.mark.asyncio
+async def test_messages_sent_throttled(
+    asession: AsyncSession,
+    cache: InMemoryCache,
+    default_organization: Organization,
+    default_phone_number: PhoneNumber,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    user = await User.repository(asession).acreate(
+        phone_number="+33679368526",
+        country="FR",
+        organization_id=default_organization.id,
+    )
+    message = await user.create_message(asession, body="Hello")
+
+    @asynccontextmanager
+    async def async_session_local():
+        yield asession
+
+    monkeypatch.setattr(app, "provider", SimulatedProvider(throttle_ratio=1))
+    monkeypatch.setattr(app.db, "async_session_local", async_session_local)
+
+    context = Context(
+        TaskiqMessage(
+            task_id="1",
+            task_name=messages_sent.task_name,
+            labels={"queue_name": Queue.interactive.value},
+            args=[[message.id]],
+            kwargs={},
+        ),
+        app.broker,
+    )
+    await messages_sent.original_func([message.id], attempt=0, context=context)
+
+    # retried later with backoff, not parked as a dead letter
+    assert await DeadLetter.repository(asession).acount() == 0
+    retry = await OutboxMessage.repository(asession).aget_by(
+        filter_by={"message_id": message.id, "attempt": 1}
+    )
+    assert retry is not None
+    assert retry.queue == Queue.interactive.value
+    assert retry.available_at is not None
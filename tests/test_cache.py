@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+import pytest
+
+from correspondence.cache import Cache, InMemoryCache
+
+
+@pytest.mark.asyncio
+async def test_inmemory_cache_add():
+    cache = InMemoryCache()
+
+    assert await cache.aadd("message:claim:1", "1", ex=timedelta(seconds=60)) is True
+    assert await cache.aadd("message:claim:1", "1", ex=timedelta(seconds=60)) is False
+
+    await cache.adelete("message:claim:1")
+    assert await cache.aadd("message:claim:1", "1") is True
+
+
+@pytest.mark.asyncio
+async def test_cache_add():
+    # without a cache backend, claims and deduplication never block
+    cache = Cache()
+
+    assert await cache.aadd("message:claim:1", "1") is True
+    assert await cache.aadd("message:claim:1", "1") is True
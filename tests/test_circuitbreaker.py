@@ -0,0 +1,42 @@
+import pytest
+
+from correspondence.circuitbreaker import (CircuitBreaker, CircuitOpen,
+                                           CircuitState, backoff_delay)
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker("nexmo", failure_rate=0.5, min_calls=4, reset_timeout=0)
+
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.closed
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.open
+
+    # reset_timeout elapsed, a single probe is allowed
+    breaker.before_call()
+    assert breaker.state == CircuitState.half_open
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.open
+
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitState.closed
+
+
+def test_circuit_breaker_open():
+    breaker = CircuitBreaker("nexmo", min_calls=1, reset_timeout=60)
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpen) as exc:
+        breaker.before_call()
+
+    assert exc.value.retry_after > 0
+
+
+def test_backoff_delay():
+    for attempt in range(10):
+        assert 0 <= backoff_delay(attempt, base=1, cap=30) <= min(30, 2**attempt)
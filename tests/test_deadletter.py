@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from correspondence.broker import message
+from correspondence.deadletter import replay_all
+from correspondence.main import app
+from correspondence.models import DeadLetter
+
+
+@pytest.mark.asyncio
+async def test_dead_letter_record(asession: AsyncSession):
+    dead_letter = {
+        "task_name": message.task_name,
+        "args": ["Hello"],
+        "error": "Exception('boom')",
+    }
+    await DeadLetter.arecord_many(asession, [dead_letter])
+    await DeadLetter.arecord_many(asession, [{**dead_letter, "error": "timeout"}])
+
+    dead_letters = await DeadLetter.repository(asession).aget_all(
+        DeadLetter.filter(task_name=message.task_name)
+    )
+    assert len(dead_letters) == 1
+    assert dead_letters[0].attempts == 2
+    assert dead_letters[0].error == "timeout"
+
+    assert (
+        await DeadLetter.repository(asession).aget_all(DeadLetter.filter(error="boom"))
+        == []
+    )
+
+
+@pytest.mark.asyncio
+async def test_dead_letter_replay(asession: AsyncSession):
+    await DeadLetter.arecord_many(
+        asession,
+        [
+            {"task_name": message.task_name, "args": [f"Hello {i}"], "error": "boom"}
+            for i in range(3)
+        ],
+    )
+
+    count = await replay_all(asession, app.broker, batch_size=2)
+    assert count == 3
+
+    assert await DeadLetter.repository(asession).aget_all(DeadLetter.filter()) == []
+    assert (
+        len(
+            await DeadLetter.repository(asession).aget_all(
+                DeadLetter.filter(replayed=True)
+            )
+        )
+        == 3
+    )
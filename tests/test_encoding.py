@@ -0,0 +1,34 @@
+from correspondence.encoding import Encoding, analyse, count_segments
+
+
+def test_analyse_gsm7():
+    info = analyse("Coucou, c'est un message initial!")
+    assert info.encoding == Encoding.gsm7
+    assert info.segments == 1
+
+    assert count_segments("a" * 160) == 1
+    assert count_segments("a" * 161) == 2
+    assert count_segments("a" * 306) == 2
+    assert count_segments("a" * 307) == 3
+
+
+def test_analyse_gsm7_extended():
+    info = analyse("€" * 80)
+    assert info.encoding == Encoding.gsm7
+    assert info.length == 160
+    assert info.segments == 1
+
+    # an escaped character is never split across two parts
+    assert count_segments("a" * 152 + "€" + "a" * 151) == 2
+    assert count_segments("a" * 152 + "€" + "a" * 152) == 3
+
+
+def test_analyse_ucs2():
+    info = analyse("ça va ?")
+    assert info.encoding == Encoding.ucs2
+    assert info.segments == 1
+
+    assert count_segments("ç" * 70) == 1
+    assert count_segments("ç" * 71) == 2
+    assert count_segments("😀" * 35) == 1
+    assert count_segments("😀" * 36) == 2
@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from correspondence.inbound import InboundMessage, areceive_many
+from correspondence.main import app
+from correspondence.models import Organization, PhoneNumber, User
+
+
+@pytest.mark.asyncio
+async def test_areceive_many(
+    asession: AsyncSession,
+    default_organization: Organization,
+    default_phone_number: PhoneNumber,
+):
+    user = await User.repository(asession).acreate(
+        phone_number="+33679368526",
+        country="FR",
+        organization_id=default_organization.id,
+    )
+
+    fragment = InboundMessage(
+        sender="+33679368526",
+        receiver=default_phone_number.number,
+        provider_id="0A0000000123ABCD1",
+        text="Hello ",
+        concat_ref="1",
+        concat_part=1,
+        concat_total=2,
+    )
+    inbounds = [
+        InboundMessage(
+            sender="+33679368526",
+            receiver=default_phone_number.number,
+            provider_id="0A0000000123ABCD0",
+            text="Hi",
+        ),
+        fragment,
+        InboundMessage(
+            sender="+33679368526",
+            receiver=default_phone_number.number,
+            provider_id="0A0000000123ABCD2",
+            text="world",
+            concat_ref="1",
+            concat_part=2,
+            concat_total=2,
+        ),
+        InboundMessage(
+            sender="+33600000009",
+            receiver=default_phone_number.number,
+            provider_id="0A0000000123ABCD3",
+            text="Who?",
+        ),
+    ]
+
+    results = await areceive_many(asession, app.routing, inbounds)
+    await asession.commit()
+
+    assert all(result.error is None for result in results.values())
+    assert results[inbounds[0]].message_id is not None
+    assert results[fragment].message_id is None
+    assert results[inbounds[2]].message_id is not None
+    # unknown senders are dropped
+    assert results[inbounds[3]].message_id is None
+
+    conversation = await user.get_conversation(asession)
+    assert conversation is not None
+    assert conversation.messages_count == 2
+    last_message = await conversation.get_last_message(asession)
+    assert last_message is not None
+    assert last_message.body == "Hello world"
@@ -1,7 +1,11 @@
 import pytest
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from correspondence.models import Organization, PhoneNumber, User
+from correspondence.main import app
+from correspondence.models import (AutoMessage, Conversation, Message,
+                                   Organization, PhoneNumber, User)
+from correspondence.simulator import SimulatedProvider
 
 
 @pytest.mark.asyncio
@@ -121,3 +125,70 @@ async def test_organization_get_from_phone_number(
     )
     assert org is not None
     assert org.id == default_phone_number.organization_id
+
+
+@pytest.mark.asyncio
+async def test_message_send_many(
+    asession: AsyncSession,
+    default_phone_number: PhoneNumber,
+    default_user: User,
+):
+    await default_user.aupdate(asession, phone_number="+33679368526")
+    default_user.phone_number = "+33679368526"
+
+    message = await default_user.create_message(
+        asession, send=False, body="Hello world!"
+    )
+
+    messages = await Message.aget_for_sending(asession, [message.id])
+    assert len(messages) == 1
+
+    results = await Message.asend_many(asession, SimulatedProvider(), messages)
+    assert results[message.id].ok
+    assert results[message.id].provider_ids is not None
+
+    await asession.refresh(message)
+    assert message.provider_ids == results[message.id].provider_ids
+    assert message.segments_count == 1
+
+
+@pytest.mark.asyncio
+async def test_automessage_send_message(
+    asession: AsyncSession,
+    default_automessage: AutoMessage,
+    default_phone_number: PhoneNumber,
+):
+    statements: list[str] = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith(("INSERT", "WITH")):
+            statements.append(statement)
+
+    event.listen(app.db.async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        message = await default_automessage.send_message(
+            asession,
+            phone_number="+33679368526",
+            defaults={"first_name": "Gil", "country": "FR"},
+            commit=False,
+        )
+    finally:
+        event.remove(app.db.async_engine.sync_engine, "before_cursor_execute", count)
+
+    # user, conversation, then message with conversation update and outbox
+    assert len(statements) == 3
+
+    assert message is not None
+    assert message.automessage_id == default_automessage.id
+    assert message.status == Message.STATUS_QUEUED
+
+    conversation = await Conversation.repository(asession).aget(message.conversation_id)
+    assert conversation is not None
+    await asession.refresh(conversation)
+    assert conversation.messages_count == 1
+    assert conversation.last_message_id == message.id
+
+    assert (
+        await default_automessage.send_message(asession, phone_number="+33679368526")
+        is None
+    )
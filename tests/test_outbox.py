@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from correspondence.conf import Queue
+from correspondence.main import app
+from correspondence.models import AutoMessage, OutboxMessage, User
+from correspondence.outbox import OutboxDispatcher
+from correspondence.utils import utc_now
+
+
+class RecordingDispatcher(OutboxDispatcher):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.enqueued: list[tuple[str, list[int]]] = []
+        self.attempts: list[int] = []
+
+    async def enqueue(
+        self, queue: str, message_ids: list[int], attempt: int = 0
+    ) -> None:
+        self.enqueued.append((queue, message_ids))
+        self.attempts.append(attempt)
+
+
+@pytest.mark.asyncio
+async def test_outbox_dispatch(asession: AsyncSession, default_user: User):
+    messages = [
+        await default_user.create_message(asession, body=f"Hello {i}") for i in range(3)
+    ]
+    await default_user.create_message(asession, send=False, body="Not sent")
+
+    assert await OutboxMessage.repository(asession).acount() == 3
+
+    dispatcher = RecordingDispatcher(app.db, batch_size=2)
+    assert await dispatcher.dispatch(asession) == 2
+    assert await dispatcher.dispatch(asession) == 1
+    assert await dispatcher.dispatch(asession) == 0
+
+    assert dispatcher.enqueued == [
+        (Queue.interactive.value, [messages[0].id, messages[1].id]),
+        (Queue.interactive.value, [messages[2].id]),
+    ]
+    assert await OutboxMessage.repository(asession).acount() == 0
+
+
+@pytest.mark.asyncio
+async def test_outbox_dispatch_campaign(
+    asession: AsyncSession, default_automessage: AutoMessage
+):
+    message = await default_automessage.send_message(
+        asession, phone_number="+33679368526"
+    )
+    assert message is not None
+    assert message.queue == Queue.campaign
+
+    dispatcher = RecordingDispatcher(app.db)
+    assert await dispatcher.dispatch(asession) == 1
+    assert dispatcher.enqueued == [(Queue.campaign.value, [message.id])]
+
+
+@pytest.mark.asyncio
+async def test_outbox_retry(asession: AsyncSession, default_user: User):
+    message = await default_user.create_message(asession, send=False, body="Hello")
+
+    await OutboxMessage.aretry_many(
+        asession, [message.id], queue=Queue.campaign.value, attempt=2, delay=60
+    )
+
+    # not available before its delay
+    dispatcher = RecordingDispatcher(app.db)
+    assert await dispatcher.dispatch(asession) == 0
+
+    await OutboxMessage.repository(asession).abulk_update(
+        filter_by={"message_id": message.id},
+        available_at=utc_now() - timedelta(seconds=1),
+    )
+
+    assert await dispatcher.dispatch(asession) == 1
+    assert dispatcher.enqueued == [(Queue.campaign.value, [message.id])]
+    assert dispatcher.attempts == [2]
@@ -0,0 +1,49 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from correspondence.models import AutoMessage, PhoneNumber
+from correspondence.personalization import compile_template, validate_body
+
+
+def test_compile_template():
+    template = compile_template("Hello {{ first_name }} {{last_name}}, {{ nope }}!")
+
+    assert template.fields == ("first_name", "last_name")
+    assert (
+        template.render({"first_name": "Gil", "last_name": None})
+        == "Hello Gil , {{ nope }}!"
+    )
+    assert compile_template("Hello {{ first_name }} {{last_name}}, {{ nope }}!") is (
+        template
+    )
+    assert compile_template("Hello").render({}) == "Hello"
+
+
+def test_validate_body():
+    body = "Hello {{ first_name }}"
+    assert validate_body(body) == body
+
+    with pytest.raises(ValueError, match="frist_name"):
+        validate_body("Hello {{ frist_name }}")
+
+    with pytest.raises(ValueError, match="frist_name"):
+        AutoMessage(body="Hello {{ frist_name }}")
+
+
+@pytest.mark.asyncio
+async def test_automessage_send_message_personalized(
+    asession: AsyncSession,
+    default_automessage: AutoMessage,
+    default_phone_number: PhoneNumber,
+):
+    default_automessage.body = "Hello {{ first_name }}, this is {{ email }}"
+    await default_automessage.asave(asession)
+
+    message = await default_automessage.send_message(
+        asession,
+        phone_number="+33679368526",
+        defaults={"first_name": "Gil", "country": "FR"},
+    )
+
+    assert message is not None
+    assert message.body == "Hello Gil, this is "
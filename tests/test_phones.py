@@ -0,0 +1,30 @@
+from correspondence import phones
+
+
+def test_normalize():
+    normalized = phones.normalize("+33 6 78 36 85 26")
+    assert normalized.e164 == "+33678368526"
+    assert normalized.region == "FR"
+    assert normalized.valid is True
+
+    # national numbers are parsed in the given region
+    assert phones.normalize("06 78 36 85 26", "FR").e164 == "+33678368526"
+    assert phones.normalize("0470 12 34 56", "BE").region == "BE"
+
+    assert phones.normalize("nope") == phones.NormalizedPhoneNumber()
+    assert phones.normalize("+33 6 78").valid is False
+
+
+def test_normalize_many():
+    phones.normalize.cache_clear()
+
+    results = phones.normalize_many(
+        ["+33 6 78 36 85 26", "nope", "+33 6 78 36 85 26"], "FR"
+    )
+
+    assert [result.e164 for result in results] == [
+        "+33678368526",
+        None,
+        "+33678368526",
+    ]
+    assert phones.normalize.cache_info().misses == 2
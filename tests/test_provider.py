@@ -0,0 +1,85 @@
+import importlib.util
+
+import httpx
+import pytest
+from pydantic import ValidationError
+
+from correspondence.conf import Settings, env, env_file
+from correspondence.provider import (MessageResult, NexmoProvider,
+                                     NoopProvider, Provider)
+
+
+class FailingProvider(Provider):
+    async def create_message(self, from_: str, to: str, body: str) -> list[str] | None:
+        if to == "+33600000001":
+            raise Exception("provider is down")
+
+        return [f"{to}-1"]
+
+
+@pytest.mark.asyncio
+async def test_provider_create_messages():
+    provider = FailingProvider(concurrency=2)
+
+    results = await provider.create_messages(
+        [
+            ("+33600000000", "+33600000002", "Hello"),
+            ("+33600000000", "+33600000001", "Hello"),
+            ("+33600000000", "+33600000003", "Hello"),
+        ]
+    )
+
+    assert len(results) == 3
+    assert results[0].provider_ids == ["+33600000002-1"]
+    assert results[1].ok is False
+    assert str(results[1].error) == "provider is down"
+    assert results[2].provider_ids == ["+33600000003-1"]
+
+
+@pytest.mark.asyncio
+async def test_noop_provider_create_messages():
+    results = await NoopProvider().create_messages(
+        [("+33600000000", "+33600000002", "Hello")]
+    )
+
+    assert results == [MessageResult()]
+
+
+class PartiallyThrottledProvider(NexmoProvider):
+    def create_client(self) -> httpx.AsyncClient:
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(
+                200,
+                json={
+                    "message-count": "2",
+                    "messages": [
+                        {"message-id": "0A0000000123ABCD1", "status": "0"},
+                        {"status": NexmoProvider.STATUS_THROTTLED},
+                    ],
+                },
+            )
+
+        return httpx.AsyncClient(
+            base_url=self.base_url, transport=httpx.MockTransport(handler)
+        )
+
+
+@pytest.mark.asyncio
+async def test_nexmo_provider_partially_throttled():
+    provider = PartiallyThrottledProvider("account", "token")
+
+    # the accepted part is kept, sending again would duplicate it
+    provider_ids = await provider.create_message(
+        "+33600000000", "+33600000001", "a" * 161
+    )
+    assert provider_ids == ["0A0000000123ABCD1"]
+
+
+def test_settings_http2_without_h2(monkeypatch):
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+
+    with pytest.raises(ValidationError, match="install httpx\\[http2\\]"):
+        Settings(_env_file=env_file, ENV=env, SMS_PROVIDER_HTTP2=True)  # type: ignore
+
+    settings = Settings(_env_file=env_file, ENV=env)  # type: ignore
+    assert settings.SMS_PROVIDER_HTTP2 is False
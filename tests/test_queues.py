@@ -0,0 +1,71 @@
+import pytest
+from taskiq import TaskiqMessage
+
+from correspondence.queues import (Lane, PriorityListQueueBroker,
+                                   PriorityRedisStreamBroker)
+
+
+def test_priority_broker_order():
+    broker = PriorityListQueueBroker(
+        "redis://127.0.0.1:6379/0",
+        lanes=[
+            Lane("interactive", concurrency=10),
+            Lane("campaign", concurrency=10, min_share=0.25),
+        ],
+    )
+
+    orders = []
+    for _ in range(8):
+        lanes = broker.order()
+        orders.append(lanes[0].queue_name)
+        lanes[0].credit = max(0.0, lanes[0].credit - 1.0)
+
+    # campaign goes first once every four dequeues
+    assert orders.count("campaign") == 2
+    assert orders[3] == "campaign"
+    assert orders[7] == "campaign"
+
+
+@pytest.mark.asyncio
+async def test_priority_stream_broker_lanes():
+    broker = PriorityRedisStreamBroker(
+        "redis://127.0.0.1:6379/0",
+        lanes=[
+            Lane("interactive", concurrency=1),
+            Lane("campaign", concurrency=1),
+        ],
+    )
+
+    await broker.acquire("interactive")
+
+    # a lane without budget left is not polled
+    lanes = await broker.available_lanes()
+    assert [lane.queue_name for lane in lanes] == ["campaign"]
+
+    broker.release("interactive")
+
+    lanes = await broker.available_lanes()
+    assert [lane.queue_name for lane in lanes] == ["interactive", "campaign"]
+
+
+def test_priority_broker_accepts():
+    broker = PriorityListQueueBroker(
+        "redis://127.0.0.1:6379/0",
+        lanes=[Lane("interactive", concurrency=1)],
+    )
+
+    @broker.task(task_name="known")
+    async def known() -> None:
+        pass
+
+    def dumps(task_name: str) -> bytes:
+        return broker.formatter.dumps(
+            TaskiqMessage(
+                task_id="1", task_name=task_name, labels={}, args=[], kwargs={}
+            )
+        ).message
+
+    # dropped by the receiver, their lane must not be acquired
+    assert not broker.accepts(b"not a message")
+    assert not broker.accepts(dumps("unknown"))
+    assert broker.accepts(dumps("known"))
@@ -0,0 +1,61 @@
+import pytest
+
+from correspondence.ratelimit import (InMemoryRateLimiter, RateLimited,
+                                      SenderRateLimiter)
+
+
+@pytest.mark.asyncio
+async def test_inmemory_rate_limiter():
+    limiter = InMemoryRateLimiter(rate=100, burst=2, min_rate=10)
+
+    await limiter.acquire()
+    await limiter.acquire()
+    assert limiter.tokens < 1
+
+    await limiter.throttled()
+    assert limiter.rate == pytest.approx(50, rel=0.1)
+    assert limiter.tokens <= 0
+
+    for _ in range(5):
+        await limiter.throttled()
+    assert limiter.rate == 10
+
+
+def test_sender_rate_limiter():
+    limiter = SenderRateLimiter(
+        lambda sender, rate: InMemoryRateLimiter(rate=rate, burst=1), rate=1
+    )
+    limiter.set_rate("+33600000001", 5)
+
+    default = limiter.get("+33600000000")
+    assert isinstance(default, InMemoryRateLimiter)
+    assert default.max_rate == 1
+    assert limiter.get("+33600000001").max_rate == 5  # type: ignore
+
+    # a new rate replaces the limiter of the number
+    limiter.set_rate("+33600000001", 2)
+    assert limiter.get("+33600000001").max_rate == 2  # type: ignore
+
+    # disabled for numbers without rate
+    limiter.set_rate("+33600000002", 0)
+    assert not isinstance(limiter.get("+33600000002"), InMemoryRateLimiter)
+
+
+@pytest.mark.asyncio
+async def test_sender_rate_limiter_max_wait():
+    limiter = SenderRateLimiter(
+        lambda sender, rate: InMemoryRateLimiter(rate=rate, burst=1),
+        rate=1,
+        max_wait=0.5,
+    )
+
+    await limiter.acquire("+33600000000")
+
+    # the next slot is a second away, it is not reserved
+    with pytest.raises(RateLimited) as exc:
+        await limiter.acquire("+33600000000")
+    assert exc.value.retry_after == pytest.approx(1, rel=0.1)
+
+    default = limiter.get("+33600000000")
+    assert isinstance(default, InMemoryRateLimiter)
+    assert default.tokens == pytest.approx(0, abs=0.1)
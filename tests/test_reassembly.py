@@ -0,0 +1,66 @@
+import os
+import uuid
+
+import pytest
+import pytest_asyncio
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import ConnectionError
+
+from correspondence.reassembly import MessageFragment, ReassemblyBuffer
+
+
+@pytest_asyncio.fixture()
+async def reassembly():
+    async with AsyncRedis.from_url(
+        os.environ.get("TEST_REDIS_URL", "redis://127.0.0.1:6379/15")
+    ) as async_redis:
+        try:
+            await async_redis.ping()
+        except ConnectionError:
+            pytest.skip("redis is not available")
+
+        yield ReassemblyBuffer(async_redis, ttl=60)
+
+
+def fragment(part: int) -> MessageFragment:
+    return MessageFragment(part=part, body=f"part {part} ", provider_id=f"id-{part}")
+
+
+@pytest.mark.asyncio
+async def test_reassembly_out_of_order(reassembly: ReassemblyBuffer):
+    ref = uuid.uuid4().hex
+
+    assert await reassembly.add(1, ref, 3, fragment(3)) is None
+    assert await reassembly.add(1, ref, 3, fragment(1)) is None
+    # same ref in another organization is another message
+    assert await reassembly.add(2, ref, 3, fragment(2)) is None
+
+    fragments = await reassembly.add(1, ref, 3, fragment(2))
+    assert fragments == [fragment(1), fragment(2), fragment(3)]
+
+
+@pytest.mark.asyncio
+async def test_reassembly_duplicates(reassembly: ReassemblyBuffer):
+    ref = uuid.uuid4().hex
+
+    assert await reassembly.add(1, ref, 2, fragment(1)) is None
+    # a retried part is not counted twice
+    assert await reassembly.add(1, ref, 2, fragment(1)) is None
+    assert await reassembly.add(1, ref, 2, fragment(2)) == [fragment(1), fragment(2)]
+
+    # retries after completion do not assemble the message again
+    assert await reassembly.add(1, ref, 2, fragment(2)) is None
+    assert await reassembly.add(1, ref, 2, fragment(1)) is None
+
+
+@pytest.mark.asyncio
+async def test_reassembly_remove(reassembly: ReassemblyBuffer):
+    ref = uuid.uuid4().hex
+
+    assert await reassembly.add(1, ref, 2, fragment(1)) is None
+    assert await reassembly.add(1, ref, 2, fragment(2)) is not None
+
+    # the message could not be written, the retry completes it again
+    await reassembly.remove(1, ref, 2)
+    await reassembly.remove(1, ref, 2)
+    assert await reassembly.add(1, ref, 2, fragment(2)) == [fragment(1), fragment(2)]
@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from correspondence.db.sql import insert
+from correspondence.main import app
+from correspondence.models import Organization, PhoneNumber
+from correspondence.routing import RoutingIndex
+from correspondence.utils import utc_now
+
+
+@pytest.mark.asyncio
+async def test_routing_index(
+    asession: AsyncSession,
+    default_organization: Organization,
+    default_phone_number: PhoneNumber,
+):
+    routing = app.routing
+
+    assert await routing.get(asession, default_phone_number.number) == (
+        default_organization.id
+    )
+    assert not routing.stale
+
+    # committed phone number changes invalidate the index
+    phone_number = await PhoneNumber.repository(asession).acreate(
+        number="+33600000001",
+        country="FR",
+        organization_id=default_organization.id,
+    )
+    assert routing.stale
+    assert await routing.get(asession, phone_number.number) == default_organization.id
+
+    assert await routing.get(asession, "+33600000002") is None
+
+
+@pytest.mark.asyncio
+async def test_routing_index_invalidated_during_load(
+    asession: AsyncSession,
+    default_phone_number: PhoneNumber,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    routing = RoutingIndex(app.db)
+    execute = asession.execute
+
+    async def invalidating_execute(*args, **kwargs):
+        routing.invalidate()
+        return await execute(*args, **kwargs)
+
+    monkeypatch.setattr(asession, "execute", invalidating_execute)
+    await routing.load(asession)
+
+    assert routing.stale
+
+
+@pytest.mark.asyncio
+async def test_routing_index_miss(
+    asession: AsyncSession,
+    default_organization: Organization,
+    default_phone_number: PhoneNumber,
+):
+    routing = RoutingIndex(app.db, miss_interval=5)
+    await routing.load(asession)
+
+    # added without invalidation, like by another process without pub/sub
+    number = "+33600000003"
+    await asession.execute(
+        insert(PhoneNumber).values(
+            number=number,
+            country="FR",
+            organization_id=default_organization.id,
+            created_at=utc_now(),
+            updated_at=utc_now(),
+        )
+    )
+
+    assert await routing.get(asession, number) is None
+
+    assert routing.loaded_at is not None
+    routing.loaded_at -= 10
+    assert await routing.get(asession, number) == default_organization.id
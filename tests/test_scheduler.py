@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from correspondence.main import app
+from correspondence.models import AutoMessage, Message, OutboxMessage, User
+from correspondence.scheduler import MessageScheduler
+from correspondence.utils import utc_now
+
+
+@pytest.mark.asyncio
+async def test_scheduler_schedule(asession: AsyncSession, default_user: User):
+    due = await default_user.create_message(
+        asession, body="Due", send_at=utc_now() - timedelta(seconds=1)
+    )
+    later = await default_user.create_message(
+        asession, body="Later", send_at=utc_now() + timedelta(hours=1)
+    )
+    assert due.status == Message.STATUS_QUEUED
+    assert later.status == Message.STATUS_SCHEDULED
+
+    # only the due message went straight to the outbox
+    assert await OutboxMessage.repository(asession).acount() == 1
+
+    scheduler = MessageScheduler(app.db)
+    assert await scheduler.schedule(asession) == 0
+
+    await later.aupdate(asession, send_at=utc_now() - timedelta(seconds=1))
+
+    assert await scheduler.schedule(asession) == 1
+    assert await scheduler.schedule(asession) == 0
+
+    await asession.refresh(later)
+    assert later.status == Message.STATUS_QUEUED
+    assert (
+        await OutboxMessage.repository(asession).acount(
+            filter_by={"message_id": later.id}
+        )
+        == 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_automessage_delay(
+    asession: AsyncSession, default_automessage: AutoMessage
+):
+    await default_automessage.aupdate(asession, delay=600)
+    default_automessage.delay = 600
+
+    message = await default_automessage.send_message(
+        asession, phone_number="+33679368526"
+    )
+    assert message is not None
+    assert message.status == Message.STATUS_SCHEDULED
+    assert message.send_at is not None
+    assert message.send_at > utc_now() + timedelta(seconds=590)
+
+    assert await OutboxMessage.repository(asession).acount() == 0
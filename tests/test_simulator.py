@@ -0,0 +1,34 @@
+import pytest
+
+from correspondence.provider import ProviderError, ProviderThrottled
+from correspondence.simulator import SimulatedProvider
+
+
+@pytest.mark.asyncio
+async def test_simulated_provider():
+    provider = SimulatedProvider()
+
+    provider_ids = await provider.create_message(
+        "+33600000000", "+33600000001", "Hello world"
+    )
+    assert provider_ids is not None
+    assert len(provider_ids) == 1
+
+    provider_ids = await provider.create_message(
+        "+33600000000", "+33600000001", "a" * 161
+    )
+    assert provider_ids is not None
+    assert len(provider_ids) == 2
+
+
+@pytest.mark.asyncio
+async def test_simulated_provider_errors():
+    provider = SimulatedProvider(throttle_ratio=1)
+
+    with pytest.raises(ProviderThrottled):
+        await provider.create_message("+33600000000", "+33600000001", "Hello")
+
+    provider = SimulatedProvider(failure_ratio=1)
+
+    with pytest.raises(ProviderError):
+        await provider.create_message("+33600000000", "+33600000001", "Hello")
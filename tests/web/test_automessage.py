@@ -4,8 +4,11 @@ import pytest
 from fastapi import status
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from correspondence.cache import InMemoryCache
+from correspondence.conf import settings
 from correspondence.models import AutoMessage, User
 from correspondence.test.client import AsyncClient
+from correspondence.web import automessage
 
 ACTIVE_CAMPAIGN_FORMDATA_COMPLETE = "contact%5Bid%5D=27760&contact%5Bemail%5D=gil.payet%40ulule.com&contact%5Bfirst_name%5D=Gil&contact%5Blast_name%5D=Payet&contact%5Bphone%5D=%2B33+6+78+36+85+26&contact%5Borgname%5D=Ulule&contact%5Bcustomer_acct_name%5D=Ulule&contact%5Btags%5D=Clicksend+Test&contact%5Bip4%5D=127.0.0.1&contact%5Bfields%5D%5Bgoogle_contacts-updated%5D=2019-06-28T08%3A12%3A35.769Z&contact%5Bfields%5D%5Bcontact_owner%5D=Alice+Pouillier&contact%5Bfields%5D%5Bgoogle_contacts-organization-name%5D=Ulule&contact%5Bfields%5D%5Bgoogle_contacts-organization-title%5D=CTO&contact%5Bfields%5D%5Bemail_lead_owner%5D=loic%40ulule.com&seriesid=929"
 
@@ -108,3 +111,169 @@ async def test_automessage_detail_without_user(
         },
     )
     assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.asyncio
+async def test_automessage_bulk(
+    aclient: AsyncClient,
+    staff_member: User,
+    default_automessage: AutoMessage,
+    asession: AsyncSession,
+):
+    url = f"/automessage/{default_automessage.id}/bulk"
+
+    response = await aclient.post(
+        url,
+        json=[
+            {"phone": "+33 6 78 36 85 26", "id": "1", "first_name": "Gil"},
+            {"phone": "+33 6 78 36 85 27", "id": "2"},
+            {"phone": "+33 6 78 36 85 26", "id": "1", "first_name": "Gil"},
+            {"phone": "nope"},
+        ],
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "created": 2,
+        "skipped": 1,
+        "invalid": ["nope"],
+        "conflicts": [],
+    }
+
+    user = await User.repository(asession).aget_by(
+        filter_by={"phone_number": "+33678368526"}
+    )
+    assert user is not None
+    assert user.manager_id == staff_member.id
+    assert user.first_name == "Gil"
+    assert user.active_campaign_id == "1"
+    assert user.country == "FR"
+
+    conversation = await user.get_conversation(asession)
+    assert conversation is not None
+    assert conversation.messages_count == 1
+    assert conversation.last_message.automessage_id == default_automessage.id
+
+    # contacts which already received the automessage are skipped
+    response = await aclient.post(
+        url,
+        content=b'{"phone": "+33678368526"}\n{"phone": "+33678368528"}\n',
+        headers={"Content-type": "application/x-ndjson"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "created": 1,
+        "skipped": 1,
+        "invalid": [],
+        "conflicts": [],
+    }
+
+    # the id of a new contact belongs to another user, or to a previous one
+    response = await aclient.post(
+        url,
+        json=[
+            {"phone": "+33 6 78 36 85 29", "id": "1"},
+            {"phone": "+33 6 78 36 85 30", "id": "3", "email": "gil@example.com"},
+            {"phone": "+33 6 78 36 85 31", "email": "gil@example.com"},
+        ],
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "created": 1,
+        "skipped": 0,
+        "invalid": [],
+        "conflicts": ["+33678368529", "+33678368531"],
+    }
+
+
+@pytest.mark.asyncio
+async def test_automessage_async(
+    aclient: AsyncClient,
+    default_automessage: AutoMessage,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    enqueued: list[tuple[int, list[dict]]] = []
+
+    async def enqueue_contacts(automessage_id: int, contacts: list[dict]) -> None:
+        enqueued.append((automessage_id, contacts))
+
+    monkeypatch.setattr(settings, "AUTOMESSAGE_ASYNC", True)
+    monkeypatch.setattr(automessage, "enqueue_contacts", enqueue_contacts)
+
+    response = await aclient.post(
+        f"/automessage/{default_automessage.id}",
+        data=ACTIVE_CAMPAIGN_FORMDATA_COMPLETE,
+        headers={
+            "Content-type": "application/x-www-form-urlencoded; charset=UTF-8",
+        },
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    assert len(enqueued) == 1
+    automessage_id, contacts = enqueued[0]
+    assert automessage_id == default_automessage.id
+    assert contacts[0]["phone_number"] == "+33678368526"
+    assert contacts[0]["country"] == "FR"
+
+
+@pytest.mark.asyncio
+async def test_automessage_async_unknown(
+    aclient: AsyncClient,
+    default_automessage: AutoMessage,
+    cache: InMemoryCache,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    enqueued: list[int] = []
+
+    async def enqueue_contacts(automessage_id: int, contacts: list[dict]) -> None:
+        enqueued.append(automessage_id)
+
+    monkeypatch.setattr(settings, "AUTOMESSAGE_ASYNC", True)
+    monkeypatch.setattr(automessage, "enqueue_contacts", enqueue_contacts)
+
+    headers = {"Content-type": "application/x-www-form-urlencoded; charset=UTF-8"}
+
+    # the worker would drop its contacts
+    response = await aclient.post(
+        f"/automessage/{default_automessage.id + 1}",
+        data=ACTIVE_CAMPAIGN_FORMDATA_COMPLETE,
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert enqueued == []
+
+    response = await aclient.post(
+        f"/automessage/{default_automessage.id}",
+        data=ACTIVE_CAMPAIGN_FORMDATA_COMPLETE,
+        headers=headers,
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert cache.cache.has(automessage.get_exists_key(default_automessage.id))
+
+
+@pytest.mark.asyncio
+async def test_automessage_dedupe(
+    aclient: AsyncClient,
+    default_automessage: AutoMessage,
+    cache: InMemoryCache,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    url = f"/automessage/{default_automessage.id}"
+    headers = {"Content-type": "application/x-www-form-urlencoded; charset=UTF-8"}
+
+    response = await aclient.post(
+        url, data=ACTIVE_CAMPAIGN_FORMDATA_PARTIAL, headers=headers
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    assert cache.cache.has(
+        automessage.get_dedupe_key(default_automessage.id, "+33678368526")
+    )
+
+    async def get_automessage_by_id(*args):
+        raise AssertionError("duplicates must not reach the database")
+
+    monkeypatch.setattr(automessage, "get_automessage_by_id", get_automessage_by_id)
+
+    response = await aclient.post(
+        url, data=ACTIVE_CAMPAIGN_FORMDATA_PARTIAL, headers=headers
+    )
+    assert response.status_code == status.HTTP_200_OK
@@ -2,8 +2,13 @@ import pytest
 from fastapi import status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from correspondence.models import MessagePart, Organization, PhoneNumber, User
+from correspondence.conf import settings
+from correspondence.inbound import InboundMessage
+from correspondence.main import app
+from correspondence.models import (MessagePart, MessageStatus, Organization,
+                                   PhoneNumber, User)
 from correspondence.test.client import AsyncClient
+from correspondence.web import hooks
 
 NEXMO_PAYLOAD_UNIQUE = {
     "msisdn": "33679368526",
@@ -152,3 +157,70 @@ async def test_hooks_nexmo_multipart(
     assert last_message is not None
     assert last_message.sender_id == user.id
     assert last_message.body == "Hello my friendHello worldBye bye"
+
+
+@pytest.mark.asyncio
+async def test_hooks_nexmo_dlr(
+    aclient: AsyncClient,
+    default_user: User,
+    asession: AsyncSession,
+):
+    message = await default_user.create_message(
+        asession, send=False, body="Hello world!"
+    )
+    await MessageStatus.atrack(asession, message.id, ["0A0000000123ABCD1"])
+
+    for status_ in ("accepted", "delivered"):
+        response = await aclient.post(
+            "/hooks/nexmo/dlr",
+            json={
+                "msisdn": "33679368526",
+                "to": "Ulule",
+                "network-code": "20801",
+                "messageId": "0A0000000123ABCD1",
+                "price": "0.03330000",
+                "status": status_,
+                "err-code": "0",
+            },
+        )
+        assert response.status_code == status.HTTP_200_OK
+
+    assert await app.receipts.flush(asession) == 1
+
+    message_status = await MessageStatus.repository(asession).aget_by(
+        filter_by={"provider_id": "0A0000000123ABCD1"}
+    )
+    assert message_status is not None
+    assert message_status.message_id == message.id
+    assert message_status.status == "delivered"
+    assert message_status.network == "20801"
+
+
+@pytest.mark.asyncio
+async def test_hooks_nexmo_async(
+    aclient: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    enqueued: list[InboundMessage] = []
+
+    async def enqueue_inbound(inbound: InboundMessage) -> None:
+        enqueued.append(inbound)
+
+    monkeypatch.setattr(settings, "INBOUND_ASYNC", True)
+    monkeypatch.setattr(hooks, "enqueue_inbound", enqueue_inbound)
+
+    # unknown numbers are only resolved by the worker
+    response = await aclient.post("/hooks/nexmo", json=NEXMO_PAYLOAD_MULTIPART[0])
+    assert response.status_code == status.HTTP_200_OK
+
+    assert enqueued == [
+        InboundMessage(
+            sender="+33679368526",
+            receiver=f"+{NEXMO_PAYLOAD_MULTIPART[0]['to'].lstrip('+')}",
+            provider_id=NEXMO_PAYLOAD_MULTIPART[0]["messageId"],
+            text=NEXMO_PAYLOAD_MULTIPART[0]["text"],
+            concat_ref="1",
+            concat_part=2,
+            concat_total=3,
+        )
+    ]